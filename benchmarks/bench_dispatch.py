@@ -0,0 +1,65 @@
+"""Microbenchmark: tag dispatch through the BLOCK_HANDLERS registry vs. the old if/elif chain.
+
+Both dispatchers call the same no-op handlers, so only the cost of picking the handler
+is measured. The element mix follows a typical assistant answer (mostly paragraphs).
+
+    python benchmarks/bench_dispatch.py [--elements N] [--repeat R]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+TAG_MIX = ["p"] * 10 + ["pre"] * 2 + ["ul", "ol", "h2", "h3", "blockquote", "table", "hr", "div"]
+
+class Element:
+    __slots__ = ("name",)
+
+    def __init__(self, name):
+        self.name = name
+
+def handler(element, previous_div=None):
+    return element
+
+def dispatch_if_chain(element):
+    # Same test order as the extractor used before the handler registry
+    if element.name == 'pre':
+        return handler(element)
+    elif element.name in ['ul', 'ol']:
+        return handler(element)
+    elif element.name and element.name.startswith('h') and len(element.name) > 1 and element.name[1].isdigit():
+        return handler(element)
+    elif element.name == 'blockquote':
+        return handler(element)
+    elif element.name == 'table':
+        return handler(element)
+    elif element.name == 'hr':
+        return handler(element)
+    elif element.name == 'p':
+        return handler(element)
+    return None
+
+def dispatch_registry(element, handlers={name: handler for name in main.BLOCK_HANDLERS}):
+    block_handler = handlers.get(element.name)
+    return block_handler(element, None) if block_handler is not None else None
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--elements", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    elements = [Element(TAG_MIX[i % len(TAG_MIX)]) for i in range(args.elements)]
+    results = {}
+    for label, dispatch in (("if/elif chain", dispatch_if_chain), ("registry", dispatch_registry)):
+        best = min(timeit.repeat(lambda: [dispatch(element) for element in elements], number=1, repeat=args.repeat))
+        results[label] = best
+        print(f"{label:>14}: {best * 1e9 / len(elements):7.1f} ns/element")
+    print(f"{'speedup':>14}: {results['if/elif chain'] / results['registry']:7.2f}x")
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,199 @@
+"""Synthetic ChatGPT export generator for benchmarks.
+
+Writes an HTML page with the markup the extractor looks for: `article[data-testid=
+conversation-turn-N]` turns, `div[data-message-author-role]` containers, user text in
+`div.whitespace-pre-wrap` and assistant answers in `div.markdown` with paragraphs,
+highlighted code blocks (with the language label row), tables, nested lists and
+blockquotes. The page is streamed to disk, so even 1 GB exports need little memory.
+
+    python benchmarks/generate_export.py out.html --size 100MB
+    python benchmarks/generate_export.py out.html --turns 300 --message-size 8000 --mix code=3,table=1
+"""
+import argparse
+import html
+import random
+
+WORDS = (
+    "the quick brown fox jumps over lazy dog export parser message turn assistant user "
+    "memory stream buffer render table column value result python function return list"
+).split()
+NON_ASCII_WORDS = "გამარჯობა საუბარი შეტყობინება ფაილი ცხრილი კოდი მეხსიერება სიტყვა".split()
+LANGUAGES = ("python", "javascript", "bash", "sql", "json")
+KEYWORDS = ("def", "return", "for", "in", "if", "else", "import", "class")
+
+# Relative weight of each kind of assistant block
+DEFAULT_MIX = {"paragraph": 5, "code": 2, "table": 1, "list": 2, "blockquote": 1, "heading": 1}
+
+SIZE_UNITS = {"KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3, "B": 1}
+
+PAGE_HEADER = (
+    '<!DOCTYPE html><html lang="en"><head><meta charset="utf-8"><title>Synthetic chat</title>'
+    '<style>.sr-only{position:absolute}</style></head><body><div id="__next"><main class="relative h-full">\n'
+)
+PAGE_FOOTER = '</main></div></body></html>\n'
+
+def parse_size(text):
+    text = text.strip().upper()
+    for unit, factor in SIZE_UNITS.items():
+        if text.endswith(unit) and text[:-len(unit)].strip():
+            return int(float(text[:-len(unit)]) * factor)
+    return int(text)
+
+def parse_mix(text):
+    mix = dict(DEFAULT_MIX)
+    for item in filter(None, text.split(",")):
+        name, _, weight = item.partition("=")
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"unknown content kind: {name}")
+        mix[name] = float(weight)
+    return mix
+
+class ExportGenerator:
+    def __init__(self, message_size=4000, mix=None, non_ascii=0.1, seed=0):
+        self.message_size = message_size
+        self.mix = mix or dict(DEFAULT_MIX)
+        self.non_ascii = non_ascii
+        self.random = random.Random(seed)
+
+    def words(self, count):
+        pick = self.random.choice
+        return " ".join(pick(NON_ASCII_WORDS) if self.random.random() < self.non_ascii else pick(WORDS)
+                        for _ in range(count))
+
+    def inline_text(self, count):
+        # Plain words with occasional inline markup, escaped as a browser would save them
+        parts = []
+        for _ in range(max(1, count // 8)):
+            parts.append(html.escape(self.words(8)))
+            roll = self.random.random()
+            if roll < 0.1:
+                parts.append(f"<code>{html.escape(self.random.choice(KEYWORDS))}()</code>")
+            elif roll < 0.2:
+                parts.append(f"<strong>{html.escape(self.words(2))}</strong>")
+            elif roll < 0.25:
+                parts.append(f'<a href="https://example.com/{self.random.randint(1, 999)}">{html.escape(self.words(2))}</a>')
+        return " ".join(parts)
+
+    def paragraph(self):
+        return f"<p>{self.inline_text(self.random.randint(20, 80))}</p>"
+
+    def heading(self):
+        level = self.random.randint(1, 4)
+        return f"<h{level}>{html.escape(self.words(4))}</h{level}>"
+
+    def code(self):
+        language = self.random.choice(LANGUAGES)
+        lines = []
+        for _ in range(self.random.randint(5, 40)):
+            indent = "    " * self.random.randint(0, 2)
+            keyword = self.random.choice(KEYWORDS)
+            lines.append(f'{indent}<span class="hljs-keyword">{keyword}</span> {html.escape(self.words(4))}')
+        return (
+            f'<div class="flex items-center relative text-token-text-secondary px-4 py-2 text-xs font-sans">'
+            f'<div>{language}</div><div>Copy code</div></div>'
+            f'<pre class="!overflow-visible"><code class="hljs language-{language}">' + "\n".join(lines) + "</code></pre>"
+        )
+
+    def table(self):
+        columns = self.random.randint(2, 6)
+        header = "".join(f"<th>{html.escape(self.words(1))}</th>" for _ in range(columns))
+        rows = "".join(
+            "<tr>" + "".join(f"<td>{html.escape(self.words(2))}</td>" for _ in range(columns)) + "</tr>"
+            for _ in range(self.random.randint(3, 30))
+        )
+        return f"<table><thead><tr>{header}</tr></thead><tbody>{rows}</tbody></table>"
+
+    def list(self, depth=0):
+        tag = self.random.choice(("ul", "ol"))
+        items = []
+        for _ in range(self.random.randint(2, 6)):
+            nested = self.list(depth + 1) if depth < 2 and self.random.random() < 0.2 else ""
+            items.append(f"<li><p>{self.inline_text(12)}</p>{nested}</li>")
+        return f"<{tag}>{''.join(items)}</{tag}>"
+
+    def blockquote(self):
+        return f"<blockquote><p>{self.inline_text(20)}</p><p>{self.inline_text(10)}</p></blockquote>"
+
+    def assistant_markdown(self):
+        kinds = list(self.mix)
+        weights = [self.mix[kind] for kind in kinds]
+        blocks = []
+        size = 0
+        while size < self.message_size:
+            kind = self.random.choices(kinds, weights)[0]
+            block = getattr(self, kind)()
+            blocks.append(block)
+            size += len(block)
+        if self.random.random() < 0.3:
+            blocks.insert(self.random.randint(0, len(blocks)), "<hr>")
+        return "".join(blocks)
+
+    def turn(self, index):
+        number = index + 1
+        if index % 2 == 0:
+            text = html.escape(self.words(self.random.randint(5, max(6, self.message_size // 40))))
+            return (
+                f'<article class="w-full text-token-text-primary" dir="auto" data-testid="conversation-turn-{number}" '
+                f'data-scroll-anchor="false"><h5 class="sr-only">You said:</h5>'
+                f'<div class="flex max-w-full flex-col grow"><div data-message-author-role="user" '
+                f'data-message-id="u-{number}" dir="auto" class="min-h-8 text-message">'
+                f'<div class="flex w-full flex-col gap-1"><div class="whitespace-pre-wrap">{text}</div></div>'
+                f'</div></div></article>\n'
+            )
+        return (
+            f'<article class="w-full text-token-text-primary" dir="auto" data-testid="conversation-turn-{number}" '
+            f'data-scroll-anchor="false"><h6 class="sr-only">ChatGPT said:</h6>'
+            f'<div class="flex max-w-full flex-col grow"><div data-message-author-role="assistant" '
+            f'data-message-id="a-{number}" dir="auto" class="min-h-8 text-message">'
+            f'<div class="flex w-full flex-col gap-1"><div class="markdown prose w-full break-words dark:prose-invert">'
+            f'{self.assistant_markdown()}</div></div></div></div></article>\n'
+        )
+
+    def write(self, path, turns=None, target_bytes=None):
+        """Writes an export with `turns` turns, or with as many turns as fit in `target_bytes`.
+
+        Returns (bytes written, number of turns).
+        """
+        written = 0
+        count = 0
+        with open(path, 'w', encoding='utf-8', newline='\n') as f:
+            written += len(PAGE_HEADER.encode('utf-8'))
+            f.write(PAGE_HEADER)
+            footer_size = len(PAGE_FOOTER)
+            while True:
+                if turns is not None and count >= turns:
+                    break
+                if turns is None and written + footer_size >= target_bytes:
+                    break
+                chunk = self.turn(count)
+                f.write(chunk)
+                written += len(chunk.encode('utf-8'))
+                count += 1
+            f.write(PAGE_FOOTER)
+            written += footer_size
+        return written, count
+
+def generate_export(path, turns=None, size=None, message_size=4000, mix=None, non_ascii=0.1, seed=0):
+    if turns is None and size is None:
+        raise ValueError("either turns or size is required")
+    return ExportGenerator(message_size, mix, non_ascii, seed).write(path, turns, size)
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("output", help="Path of the HTML file to write.")
+    parser.add_argument("--size", type=parse_size, help="Approximate file size, e.g. 1MB, 250MB, 1GB.")
+    parser.add_argument("--turns", type=int, help="Number of conversation turns (overrides --size).")
+    parser.add_argument("--message-size", type=int, default=4000, help="Approximate characters of markup per assistant message.")
+    parser.add_argument("--mix", type=parse_mix, default=dict(DEFAULT_MIX),
+                        help="Block weights, e.g. paragraph=5,code=2,table=1,list=2,blockquote=1,heading=1")
+    parser.add_argument("--non-ascii", type=float, default=0.1, help="Share of Georgian words in the text. Default: 0.1")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.turns is None and args.size is None:
+        parser.error("one of --size or --turns is required")
+
+    written, turns = generate_export(args.output, args.turns, args.size, args.message_size, args.mix, args.non_ascii, args.seed)
+    print(f"Wrote {args.output}: {written / 1024 ** 2:.1f} MB, {turns} turns")
+
+if __name__ == '__main__':
+    main_cli()
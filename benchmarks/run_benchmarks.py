@@ -0,0 +1,162 @@
+"""Benchmark runner for the extractor.
+
+Generates synthetic exports (see generate_export.py) for each size, then extracts every
+one with each parser backend and mode in a fresh subprocess, so peak RSS is measured per
+run. Per-stage timings come from the extractor's own metrics (read, parse, discover,
+render, serialize; streaming mode also reports the tokenize stage and mapped mode the
+byte scan; parallel mode renders the turns on one worker process per CPU and reports
+the summed worker stages with a worker_ prefix; its peak RSS is the larger of the main
+process and the largest worker).
+Results are written as JSON and can be compared with an earlier run.
+
+    python benchmarks/run_benchmarks.py --sizes 1MB,10MB,100MB --parsers html.parser,lxml
+    python benchmarks/run_benchmarks.py --sizes 1MB,10MB,100MB,1GB --compare previous.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+sys.path.insert(0, BENCHMARKS_DIR)
+
+from generate_export import DEFAULT_MIX, generate_export, parse_mix, parse_size  # noqa: E402
+
+DEFAULT_SIZES = "1MB,10MB,100MB,1GB"
+MODES = ("tree", "stream", "mapped", "parallel")
+
+def peak_rss_mb(who="self"):
+    """Peak RSS of this process, or with who="children" of its largest (finished) child process."""
+    try:
+        import resource
+    except ImportError: # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF if who == "self" else resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1) # bytes on macOS, KB elsewhere
+
+def run_case(html_path, parser, mode, output_format):
+    """Extracts one file in this process and returns timings. Runs inside the worker subprocess."""
+    import main
+
+    session = main.Session(quiet=True) # Keep status messages out of the benchmark output
+    metrics = session.metrics
+    output_path = os.path.join(tempfile.mkdtemp(prefix="chat-bench-"), "out" + main.OUTPUT_FORMATS[output_format])
+    started = time.perf_counter()
+
+    with main.use_session(session):
+        if mode == "stream":
+            count = main.stream_chat_history_to_json(html_path, output_path, parser=parser, output_format=output_format)
+        elif mode == "mapped":
+            count = main.mapped_chat_history_to_json(html_path, output_path, parser, output_format)
+        elif mode == "parallel":
+            count = main.parallel_chat_history_to_json(html_path, output_path, parser, output_format,
+                                                       jobs=os.cpu_count())
+        else:
+            count = main.extract_chat_history_to_json(html_path, output_path, parser, output_format)
+
+    seconds = time.perf_counter() - started
+    own_rss, children_rss = peak_rss_mb(), peak_rss_mb("children") # Parallel mode renders in worker processes
+    output_bytes = os.path.getsize(output_path) if os.path.exists(output_path) else 0
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    return {
+        "seconds": round(seconds, 4),
+        "stages": {name: round(value, 4) for name, value in metrics.stages.items()},
+        "turns": metrics.counters.get("turns_found", 0),
+        "messages": count or 0,
+        "output_bytes": output_bytes,
+        "peak_rss_mb": max(own_rss, children_rss) if own_rss is not None else None,
+        "peak_rss_children_mb": children_rss,
+    }
+
+def run_in_subprocess(html_path, parser, mode, output_format):
+    command = [sys.executable, os.path.abspath(__file__), "--worker", html_path, parser, mode, output_format]
+    completed = subprocess.run(command, capture_output=True, text=True)
+    if completed.returncode != 0:
+        return {"error": completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "worker failed"}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def compare(results, previous_path):
+    with open(previous_path, 'r', encoding='utf-8') as f:
+        previous = {(r["size"], r["parser"], r["mode"]): r for r in json.load(f)["results"] if "seconds" in r}
+    print(f"\nComparison with {previous_path}:")
+    for result in results:
+        before = previous.get((result["size"], result["parser"], result["mode"]))
+        if before is None or "seconds" not in result:
+            continue
+        change = (result["seconds"] - before["seconds"]) / before["seconds"] * 100 if before["seconds"] else 0.0
+        print(f"  {result['size']:>6} {result['parser']:<12} {result['mode']:<6} "
+              f"{before['seconds']:8.2f}s -> {result['seconds']:8.2f}s ({change:+.1f}%)")
+
+def main_cli():
+    if len(sys.argv) > 1 and sys.argv[1] == "--worker":
+        print(json.dumps(run_case(*sys.argv[2:6])))
+        return
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"Comma-separated export sizes. Default: {DEFAULT_SIZES}")
+    parser.add_argument("--parsers", default="html.parser,lxml,selectolax", help="Comma-separated parser backends.")
+    parser.add_argument("--modes", default=",".join(MODES), help="Comma-separated modes: tree, stream, mapped, parallel.")
+    parser.add_argument("--format", dest="output_format", default="json", choices=("json", "jsonl"))
+    parser.add_argument("--message-size", type=int, default=4000, help="Approximate markup characters per assistant message.")
+    parser.add_argument("--mix", type=parse_mix, default=dict(DEFAULT_MIX), help="Content mix, see generate_export.py.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=None, help="Where generated exports are kept (reused between runs).")
+    parser.add_argument("-o", "--output", default="benchmark-results.json", help="Path of the results JSON file.")
+    parser.add_argument("--compare", default=None, help="Earlier results file to compare against.")
+    args = parser.parse_args()
+
+    workdir = args.workdir or os.path.join(tempfile.gettempdir(), "chat-export-bench")
+    os.makedirs(workdir, exist_ok=True)
+    results = []
+    for size_label in filter(None, args.sizes.split(",")):
+        size = parse_size(size_label)
+        html_path = os.path.join(workdir, f"export-{size_label.lower()}-m{args.message_size}-s{args.seed}.html")
+        if not os.path.exists(html_path):
+            print(f"Generating {size_label} export...", flush=True)
+            generate_export(html_path, size=size, message_size=args.message_size, mix=args.mix, seed=args.seed)
+        input_bytes = os.path.getsize(html_path)
+
+        for parser_name in filter(None, args.parsers.split(",")):
+            for mode in filter(None, args.modes.split(",")):
+                result = {"size": size_label, "input_bytes": input_bytes, "parser": parser_name, "mode": mode}
+                result.update(run_in_subprocess(html_path, parser_name, mode, args.output_format))
+                if "error" in result:
+                    print(f"{size_label:>6} {parser_name:<12} {mode:<6} failed: {result['error']}")
+                else:
+                    seconds = result["seconds"] or 1e-9
+                    result["mb_per_s"] = round(input_bytes / (1024 * 1024) / seconds, 2)
+                    result["turns_per_s"] = round(result["turns"] / seconds, 1)
+                    stages = " ".join(f"{name}={value:.2f}s" for name, value in result["stages"].items())
+                    print(f"{size_label:>6} {parser_name:<12} {mode:<6} {result['seconds']:8.2f}s "
+                          f"{result['mb_per_s']:8.2f} MB/s {result['turns_per_s']:9.1f} turns/s "
+                          f"rss={result['peak_rss_mb']} MB (workers {result['peak_rss_children_mb']} MB) {stages}",
+                          flush=True)
+                results.append(result)
+
+    report = {
+        "meta": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "message_size": args.message_size,
+            "mix": args.mix,
+            "seed": args.seed,
+            "format": args.output_format,
+        },
+        "results": results,
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main_cli()
@@ -1,13 +1,29 @@
 import json
 import argparse
+import codecs
+import collections
+import contextlib
+import contextvars
+import glob
+import hashlib
+import io
+import math
 import os
-from bs4 import BeautifulSoup
+import queue
+import re
+import sys
+import threading
+import time
+from html.parser import HTMLParser
+# bs4, the optional parser backends and the process pool are imported on first use, so
+# importing this module (and `--help`) stays fast.
 
 # --- Language Configuration ---
 LANGUAGES = {
     "en": {
         "error_html_not_found": "Error: HTML file not found at {path}",
         "error_reading_html": "Error reading HTML file: {error}",
+        "error_parser_unavailable": "Error: parser backend '{parser}' is not available ({error}). Install it with: pip install {parser}",
         "no_turns_found": "No conversation turns found with the specified <article> structure.",
         "check_html_structure": "Please check the HTML structure and adjust the script if necessary.",
         "attempting_direct_find": "Attempting to find message containers directly...",
@@ -19,25 +35,108 @@ LANGUAGES = {
         "error_writing_json": "Error writing JSON file: {error}",
         "history_extracted_success": "Chat history successfully extracted to {path}",
         "cli_description": "Extracts chat history from an HTML file and saves it as a JSON format.",
-        "cli_html_file_help": "Path to the HTML file from which to extract data.",
+        "cli_html_file_help": (
+            "Path to the HTML file from which to extract data.\n"
+            "Several files, directories (searched recursively for .html/.htm) or quoted glob\n"
+            "patterns switch to batch mode. An account data export (.zip, read in place, or its\n"
+            "conversations.json) is converted conversation by conversation."
+        ),
         "cli_output_help": (
             "Path to the JSON file where the extracted chat history will be saved.\n"
             "If not specified, a file with the same name as the HTML file (but .json extension)\n"
-            "will be created in the same directory."
+            "will be created in the same directory.\n"
+            "In batch mode this is the output directory instead. For a data export it is the\n"
+            "directory for one file per conversation, or a .jsonl file for a single stream."
         ),
+        "cli_jobs_help": (
+            "Number of worker processes. Batch mode converts files in parallel (default: number\n"
+            "of CPUs); for a single file, N > 1 renders its turns in parallel (same JSON as serial)."
+        ),
+        "cli_manifest_help": "Batch mode: path of the JSON summary manifest. Default: {name} in the output directory",
         "cli_language_help": "Language for script messages (en or ka). Default: en",
+        "cli_mmap_help": (
+            "Memory-map the file and locate turns with a byte scan (encoding taken from the BOM or\n"
+            "<meta charset>); only one turn at a time is decoded and parsed. Same JSON as --stream."
+        ),
+        "cli_stream_help": (
+            "Streaming mode: feed the HTML to an incremental parser in fixed-size chunks and\n"
+            "process one conversation turn at a time instead of building the whole document tree.\n"
+            "Memory stays bounded by the largest single turn; the JSON output is identical."
+        ),
+        "cli_chunk_size_help": "Chunk size in characters for --stream. Default: {size}",
+        "cli_parser_help": (
+            "HTML parser backend: html.parser (pure Python, always available), lxml or selectolax\n"
+            "(native, installed separately). All backends produce the same JSON. Default: {parser}"
+        ),
         "verification_header": "\n--- Verification ---",
         "verification_extracted_count": "Extracted {count} messages.",
         "verification_first_message": "First message:",
         "verification_last_message": "Last message:",
-        "verification_json_empty": "JSON file ({path}) is empty.",
-        "verification_json_not_created": "JSON file {path} was not created.",
-        "error_decode_json": "Error: Could not decode the JSON file {path}. It might be malformed.",
-        "error_verification": "An error occurred during verification: {error}"
+        "error_unexpected": "Unexpected error while processing {path}: {error}",
+        "error_duplicate_output": "Skipped {path}: its output {output} is already written for {other}.",
+        "no_input_files": "No HTML files matched the given inputs.",
+        "batch_summary": "Processed {files} files: {ok} extracted, {empty} empty, {failed} failed ({messages} messages in {seconds:.1f}s).",
+        "batch_manifest_written": "Manifest written to {path}",
+        "cache_file_unchanged": "Unchanged since the last run, output kept: {path}",
+        "cache_stats": "Cache: {file_hits} file hits, {file_misses} file misses, {turn_hits} turn hits, {turn_misses} turn misses, {evictions} evictions.",
+        "cache_overrides_options": "Note: --cache-dir uses the memory-mapped extractor; {options} ignored.",
+        "cli_cache_dir_help": (
+            "Directory of the incremental cache. Unchanged files are skipped and only turns\n"
+            "that were not rendered before are decoded and parsed (uses the --mmap byte scan)."
+        ),
+        "cli_cache_size_help": "Maximum cache size in MB; least recently used entries are evicted. Default: {size}",
+        "cli_format_help": (
+            "Output format: json (an indented JSON array) or jsonl (JSON Lines, one message per line).\n"
+            "Messages are written as soon as they are extracted. Default: {format}"
+        ),
+        "error_reading_export": "Error reading the data export {path}: {error}",
+        "export_conversations_written": "Extracted {messages} messages from {conversations} conversations to {path} ({empty} conversations without messages skipped).",
+        "index_file_failed": "Could not index {path}: {error}",
+        "index_summary": "Indexed {indexed} files ({messages} messages); {unchanged} unchanged, {failed} failed, {removed} removed ({seconds:.1f}s).",
+        "error_index_not_found": "Error: index database not found: {path} (create it with: main.py index <files>)",
+        "search_summary": "{count} results in {milliseconds:.1f} ms.",
+        "watch_started": "Watching {directory} ({watcher}, {jobs} workers, queue of {queue_size}); stats in {stats}. Press Ctrl+C to stop.",
+        "watch_file_processed": "[{status}] {path}: {messages} messages in {seconds:.2f}s ({queued} queued)",
+        "watch_stopped": "Stopped watching: {processed} files processed, {failed} failed. Stats: {stats}",
+        "error_watch_directory": "Error: {path} is not a directory.",
+        "metrics_written": "Metrics written to {path}",
+        "profile_written": "Profile written to {path} (inspect with: python -m pstats {path})",
+        "cli_subcommands": (
+            "Subcommands (see main.py <subcommand> -h):\n"
+            "  index   add extracted chats to a full-text search index\n"
+            "  search  search that index\n"
+            "  watch   convert HTML exports as they appear in a directory"
+        ),
+        "cli_index_description": "Adds extracted chats (.json/.jsonl outputs or HTML exports) to a full-text search index.",
+        "cli_index_inputs_help": "Extracted .json/.jsonl files, HTML exports, directories or glob patterns.",
+        "cli_db_help": "Path of the index database. Default: {name}",
+        "cli_index_parser_help": "HTML parser backend for HTML inputs. Default: {parser}",
+        "cli_prune_help": "Remove indexed files that no longer exist.",
+        "cli_search_description": "Searches the full-text index of extracted chats.",
+        "cli_query_help": "FTS5 query: words, \"exact phrases\", prefix*, AND/OR/NOT.",
+        "cli_limit_help": "Maximum number of results. Default: {limit}",
+        "cli_speaker_help": "Only search messages of this speaker.",
+        "cli_search_json_help": "Print the results as JSON Lines.",
+        "cli_watch_description": "Converts HTML exports as they appear in a directory, in one long-running process.",
+        "cli_watch_directory_help": "Directory to watch (its subdirectories are not watched).",
+        "cli_watch_output_help": "Directory for the outputs. Default: next to each HTML file",
+        "cli_watch_jobs_help": "Worker processes kept warm (1 converts in the watching process). Default: 1",
+        "cli_queue_size_help": "Maximum number of files waiting for a worker. Default: {size}",
+        "cli_debounce_help": "Seconds a file must stay unchanged before it is converted. Default: {seconds}",
+        "cli_poll_help": "Poll the directory instead of using inotify (e.g. on network file systems).",
+        "cli_poll_interval_help": "Seconds between directory scans when polling. Default: {seconds}",
+        "cli_stats_help": "Stats file, rewritten every {seconds:g}s. Default: {name} in the output directory",
+        "cli_metrics_help": (
+            "Append per-file stage timings and counters as JSON Lines to this file\n"
+            "('-' writes them to stderr)."
+        ),
+        "cli_profile_help": "Run under cProfile and save the stats next to the output as <output>.prof.",
+        "cli_trace_memory_help": "Record the tracemalloc peak and the top allocation sites in the metrics."
     },
     "ka": {
         "error_html_not_found": "შეცდომა: HTML ფაილი ვერ მოიძებნა მითითებულ გზაზე: {path}",
         "error_reading_html": "შეცდომა HTML ფაილის წაკითხვისას: {error}",
+        "error_parser_unavailable": "შეცდომა: პარსერი '{parser}' მიუწვდომელია ({error}). დააინსტალირეთ ბრძანებით: pip install {parser}",
         "no_turns_found": "ვერ მოიძებნა საუბრის სტრუქტურა მითითებული <article> ტეგებით.",
         "check_html_structure": "გთხოვთ, შეამოწმოთ HTML სტრუქტურა და საჭიროებისამებრ შეცვალოთ სკრიპტი.",
         "attempting_direct_find": "ვცდილობ შეტყობინებების კონტეინერების პირდაპირ მოძებნას...",
@@ -49,262 +148,3026 @@ LANGUAGES = {
         "error_writing_json": "შეცდომა JSON ფაილში ჩაწერისას: {error}",
         "history_extracted_success": "ჩატის ისტორია წარმატებით იქნა შენახული ფაილში: {path}",
         "cli_description": "ამოიღებს ჩატის ისტორიას HTML ფაილიდან და შეინახავს JSON ფორმატში.",
-        "cli_html_file_help": "HTML ფაილის მისამართი, საიდანაც უნდა მოხდეს მონაცემების ამოღება.",
+        "cli_html_file_help": (
+            "HTML ფაილის მისამართი, საიდანაც უნდა მოხდეს მონაცემების ამოღება.\n"
+            "რამდენიმე ფაილის, დირექტორიის (.html/.htm ფაილები რეკურსიულად მოიძებნება) ან\n"
+            "ბრჭყალებში ჩასმული glob შაბლონის მითითებისას ირთვება პაკეტური რეჟიმი. ანგარიშის\n"
+            "მონაცემების ექსპორტი (.zip, იკითხება გახსნის გარეშე, ან მისი conversations.json)\n"
+            "მუშავდება საუბარ-საუბარ."
+        ),
         "cli_output_help": (
             "JSON ფაილის მისამართი, სადაც შეინახება ამოღებული ჩატის ისტორია.\n"
             "თუ არ არის მითითებული, შეიქმნება ფაილი იგივე სახელით, რაც HTML ფაილს აქვს,\n"
-            "ოღონდ .json გაფართოებით, იმავე დირექტორიაში."
+            "ოღონდ .json გაფართოებით, იმავე დირექტორიაში.\n"
+            "პაკეტურ რეჟიმში ეს არის შედეგების დირექტორია. მონაცემების ექსპორტისთვის ეს არის\n"
+            "დირექტორია, სადაც თითო საუბარი ცალკე ფაილში ჩაიწერება, ან .jsonl ფაილი ერთიანი ნაკადისთვის."
+        ),
+        "cli_jobs_help": (
+            "დამმუშავებელი პროცესების რაოდენობა. პაკეტურ რეჟიმში ფაილები პარალელურად მუშავდება\n"
+            "(ნაგულისხმევი: პროცესორების რაოდენობა); ერთი ფაილისთვის N > 1 მისი ნაბიჯების პარალელურ\n"
+            "დამუშავებას რთავს (JSON შედეგი იგივეა, რაც თანმიმდევრულისას)."
         ),
+        "cli_manifest_help": "პაკეტური რეჟიმი: JSON შემაჯამებელი მანიფესტის მისამართი. ნაგულისხმევი: {name} შედეგების დირექტორიაში",
         "cli_language_help": "სკრიპტის შეტყობინებების ენა (en ან ka). ნაგულისხმევი: en",
+        "cli_mmap_help": (
+            "ფაილის მეხსიერებაში ასახვა (mmap) და ნაბიჯების მოძებნა ბაიტების სკანირებით (კოდირება\n"
+            "განისაზღვრება BOM-ით ან <meta charset>-ით); ერთდროულად მხოლოდ ერთი ნაბიჯი დეკოდირდება\n"
+            "და მუშავდება. JSON შედეგი იგივეა, რაც --stream-ით."
+        ),
+        "cli_stream_help": (
+            "ნაკადური რეჟიმი: HTML ფაილი ინკრემენტულ პარსერს მიეწოდება ფიქსირებული ზომის ნაწილებად\n"
+            "და საუბრის თითო ნაბიჯი მუშავდება ცალ-ცალკე, მთელი დოკუმენტის ხის აგების გარეშე.\n"
+            "მეხსიერება შემოიფარგლება ყველაზე დიდი ნაბიჯის ზომით; JSON შედეგი იდენტურია."
+        ),
+        "cli_chunk_size_help": "ნაწილის ზომა სიმბოლოებში --stream რეჟიმისთვის. ნაგულისხმევი: {size}",
+        "cli_parser_help": (
+            "HTML პარსერი: html.parser (სუფთა Python, ყოველთვის ხელმისაწვდომია), lxml ან selectolax\n"
+            "(ნატიური, ცალკე ინსტალირდება). ყველა პარსერი ერთსა და იმავე JSON-ს აბრუნებს. ნაგულისხმევი: {parser}"
+        ),
         "verification_header": "\n--- ვერიფიკაცია ---",
         "verification_extracted_count": "ამოღებულია {count} შეტყობინება.",
         "verification_first_message": "პირველი შეტყობინება:",
         "verification_last_message": "ბოლო შეტყობინება:",
-        "verification_json_empty": "JSON ფაილი ({path}) ცარიელია.",
-        "verification_json_not_created": "JSON ფაილი {path} არ შეიქმნა.",
-        "error_decode_json": "შეცდომა: ვერ მოხერხდა JSON ფაილის ({path}) დეკოდირება. შესაძლოა, ფაილი დაზიანებულია.",
-        "error_verification": "ვერიფიკაციისას მოხდა შეცდომა: {error}"
+        "error_unexpected": "მოულოდნელი შეცდომა ფაილის ({path}) დამუშავებისას: {error}",
+        "error_duplicate_output": "{path} გამოტოვებულია: მისი შედეგის ფაილი {output} უკვე იწერება {other}-ისთვის.",
+        "no_input_files": "მითითებულ შესატანებს HTML ფაილები არ შეესაბამება.",
+        "batch_summary": "დამუშავდა {files} ფაილი: {ok} ამოღებული, {empty} ცარიელი, {failed} წარუმატებელი ({messages} შეტყობინება, {seconds:.1f} წმ).",
+        "batch_manifest_written": "მანიფესტი შენახულია ფაილში: {path}",
+        "cache_file_unchanged": "ფაილი ბოლო გაშვების შემდეგ არ შეცვლილა, შედეგი უცვლელია: {path}",
+        "cache_stats": "ქეში: ფაილები — {file_hits} მოხვედრა, {file_misses} აცდენა; ნაბიჯები — {turn_hits} მოხვედრა, {turn_misses} აცდენა; {evictions} წაშლა.",
+        "cache_overrides_options": "შენიშვნა: --cache-dir იყენებს მეხსიერებაში ასახულ (mmap) ამომღებს; {options} იგნორირებულია.",
+        "cli_cache_dir_help": (
+            "ინკრემენტული ქეშის დირექტორია. უცვლელი ფაილები გამოტოვდება და მუშავდება მხოლოდ\n"
+            "ის ნაბიჯები, რომლებიც ადრე არ დამუშავებულა (გამოიყენება --mmap-ის ბაიტების სკანირება)."
+        ),
+        "cli_cache_size_help": "ქეშის მაქსიმალური ზომა MB-ში; ყველაზე დიდი ხნის უნახავი ჩანაწერები იშლება. ნაგულისხმევი: {size}",
+        "cli_format_help": (
+            "შედეგის ფორმატი: json (JSON მასივი შეწევებით) ან jsonl (JSON Lines, თითო შეტყობინება თითო ხაზზე).\n"
+            "შეტყობინებები ჩაიწერება ამოღებისთანავე. ნაგულისხმევი: {format}"
+        ),
+        "error_reading_export": "შეცდომა მონაცემების ექსპორტის ({path}) წაკითხვისას: {error}",
+        "export_conversations_written": "{conversations} საუბრიდან ამოღებულია {messages} შეტყობინება და შენახულია აქ: {path} (გამოტოვებულია {empty} საუბარი შეტყობინებების გარეშე).",
+        "index_file_failed": "ვერ მოხერხდა ფაილის ({path}) ინდექსირება: {error}",
+        "index_summary": "ინდექსირებულია {indexed} ფაილი ({messages} შეტყობინება); {unchanged} უცვლელი, {failed} წარუმატებელი, {removed} წაშლილი ({seconds:.1f} წმ).",
+        "error_index_not_found": "შეცდომა: ინდექსის მონაცემთა ბაზა ვერ მოიძებნა: {path} (შექმენით ბრძანებით: main.py index <ფაილები>)",
+        "search_summary": "{count} შედეგი {milliseconds:.1f} მწ-ში.",
+        "watch_started": "მიმდინარეობს {directory}-ის თვალყურის დევნება ({watcher}, {jobs} დამმუშავებელი, რიგი: {queue_size}); სტატისტიკა: {stats}. შესაწყვეტად დააჭირეთ Ctrl+C-ს.",
+        "watch_file_processed": "[{status}] {path}: {messages} შეტყობინება, {seconds:.2f} წმ (რიგში {queued})",
+        "watch_stopped": "თვალყურის დევნება შეწყდა: დამუშავდა {processed} ფაილი, {failed} წარუმატებელი. სტატისტიკა: {stats}",
+        "error_watch_directory": "შეცდომა: {path} არ არის დირექტორია.",
+        "metrics_written": "მეტრიკები ჩაიწერა ფაილში: {path}",
+        "profile_written": "პროფილი შენახულია ფაილში: {path} (სანახავად: python -m pstats {path})",
+        "cli_subcommands": (
+            "ქვებრძანებები (იხ. main.py <ქვებრძანება> -h):\n"
+            "  index   ამოღებული ჩატების დამატება სრულტექსტოვან საძიებო ინდექსში\n"
+            "  search  ძიება ამ ინდექსში\n"
+            "  watch   დირექტორიაში გაჩენილი HTML ექსპორტების კონვერტაცია"
+        ),
+        "cli_index_description": "ამატებს ამოღებულ ჩატებს (.json/.jsonl შედეგებს ან HTML ექსპორტებს) სრულტექსტოვან საძიებო ინდექსში.",
+        "cli_index_inputs_help": "ამოღებული .json/.jsonl ფაილები, HTML ექსპორტები, დირექტორიები ან glob შაბლონები.",
+        "cli_db_help": "ინდექსის მონაცემთა ბაზის მისამართი. ნაგულისხმევი: {name}",
+        "cli_index_parser_help": "HTML პარსერი HTML ფაილებისთვის. ნაგულისხმევი: {parser}",
+        "cli_prune_help": "ინდექსიდან წაიშალოს ფაილები, რომლებიც აღარ არსებობს.",
+        "cli_search_description": "ეძებს ამოღებული ჩატების სრულტექსტოვან ინდექსში.",
+        "cli_query_help": "FTS5 მოთხოვნა: სიტყვები, \"ზუსტი ფრაზები\", პრეფიქსი*, AND/OR/NOT.",
+        "cli_limit_help": "შედეგების მაქსიმალური რაოდენობა. ნაგულისხმევი: {limit}",
+        "cli_speaker_help": "ძიება მხოლოდ ამ მოსაუბრის შეტყობინებებში.",
+        "cli_search_json_help": "შედეგები გამოიტანოს JSON Lines ფორმატით.",
+        "cli_watch_description": "ერთ გაშვებულ პროცესში აკონვერტებს HTML ექსპორტებს, როგორც კი ისინი დირექტორიაში გაჩნდება.",
+        "cli_watch_directory_help": "დირექტორია, რომელსაც თვალყური ედევნება (ქვედირექტორიების გარეშე).",
+        "cli_watch_output_help": "შედეგების დირექტორია. ნაგულისხმევი: თითოეული HTML ფაილის გვერდით",
+        "cli_watch_jobs_help": "მზა მდგომარეობაში შენახული დამმუშავებელი პროცესები (1 — კონვერტაცია თავად ამ პროცესში). ნაგულისხმევი: 1",
+        "cli_queue_size_help": "დამმუშავებლის მომლოდინე ფაილების მაქსიმალური რაოდენობა. ნაგულისხმევი: {size}",
+        "cli_debounce_help": "წამები, რომლის განმავლობაშიც ფაილი არ უნდა შეიცვალოს კონვერტაციამდე. ნაგულისხმევი: {seconds}",
+        "cli_poll_help": "inotify-ის ნაცვლად დირექტორიის პერიოდული შემოწმება (მაგ. ქსელურ ფაილურ სისტემებზე).",
+        "cli_poll_interval_help": "წამები დირექტორიის შემოწმებებს შორის. ნაგულისხმევი: {seconds}",
+        "cli_stats_help": "სტატისტიკის ფაილი, განახლდება ყოველ {seconds:g} წამში. ნაგულისხმევი: {name} შედეგების დირექტორიაში",
+        "cli_metrics_help": (
+            "ეტაპების დროები და მთვლელები JSON Lines ფორმატით დაემატება ამ ფაილს, თითო ხაზი\n"
+            "თითო ფაილზე ('-' მათ stderr-ში გამოიტანს)."
+        ),
+        "cli_profile_help": "cProfile-ით გაშვება; სტატისტიკა შეინახება შედეგის გვერდით, როგორც <output>.prof.",
+        "cli_trace_memory_help": "მეტრიკებში ჩაიწეროს tracemalloc-ის პიკი და მეხსიერების ყველაზე დიდი გამოყოფის ადგილები."
     }
 }
 
-CURRENT_LANG = "en" # Default language
-TEXTS = LANGUAGES[CURRENT_LANG]
+DEFAULT_LANG = "en"
+
+class Session:
+    """State of one extraction: the message language, where status messages go, and its Metrics.
+
+    Status messages are printed by default, appended to `log` (as {"kind", "text"} dicts)
+    when it is a list, or dropped when `quiet` is set.
+    """
+
+    def __init__(self, language=DEFAULT_LANG, log=None, quiet=False):
+        self.language = DEFAULT_LANG
+        self.texts = LANGUAGES[DEFAULT_LANG]
+        self.set_language(language)
+        self.log = log
+        self.quiet = quiet
+        self.metrics = Metrics()
+
+    def set_language(self, lang_code):
+        if lang_code not in LANGUAGES:
+            print(f"Warning: Language code '{lang_code}' not supported. Using default 'en'.") # Keep this in English as a fallback
+            lang_code = DEFAULT_LANG
+        self.language = lang_code
+        self.texts = LANGUAGES[lang_code]
+
+# Every thread and asyncio task sees its own current session, so concurrent extractions
+# never share status messages or metrics.
+CURRENT_SESSION = contextvars.ContextVar("session")
+
+def current_session():
+    try:
+        return CURRENT_SESSION.get()
+    except LookupError: # First use in this thread or context: printed English messages
+        session = Session()
+        CURRENT_SESSION.set(session)
+        return session
+
+def current_metrics():
+    return current_session().metrics
+
+@contextlib.contextmanager
+def use_session(session):
+    """Makes `session` the current one for the body of the `with` block."""
+    token = CURRENT_SESSION.set(session)
+    try:
+        yield session
+    finally:
+        CURRENT_SESSION.reset(token)
+
+def run_in_session(generator, session):
+    """Drives `generator` in a context of its own where `session` is current.
+
+    Each step runs through `Context.run`, so the session stays attached to the generator
+    no matter which thread or task consumes it, and never leaks into the caller.
+    """
+    context = contextvars.copy_context()
+    context.run(CURRENT_SESSION.set, session)
+    try:
+        while True:
+            try:
+                item = context.run(next, generator)
+            except StopIteration as stop:
+                return stop.value
+            yield item
+    finally:
+        context.run(generator.close)
 
 def set_language(lang_code):
-    global CURRENT_LANG, TEXTS
-    if lang_code in LANGUAGES:
-        CURRENT_LANG = lang_code
-        TEXTS = LANGUAGES[lang_code]
+    current_session().set_language(lang_code)
+
+def report(key, **fields):
+    session = current_session()
+    reports = session.metrics.reports
+    reports[key] = reports.get(key, 0) + 1
+    if not session.quiet:
+        deliver_report(session, key, session.texts[key].format(**fields))
+
+def deliver_report(session, key, text):
+    if session.log is not None:
+        session.log.append({"kind": key, "text": text})
     else:
-        print(f"Warning: Language code '{lang_code}' not supported. Using default 'en'.") # Keep this in English as a fallback
-        CURRENT_LANG = "en"
-        TEXTS = LANGUAGES["en"]
+        print(text)
+
+def replay_reports(log):
+    """Re-emits status messages collected in a worker process through the current session."""
+    session = current_session()
+    reports = session.metrics.reports
+    for entry in log:
+        reports[entry["kind"]] = reports.get(entry["kind"], 0) + 1
+        if not session.quiet:
+            deliver_report(session, entry["kind"], entry["text"])
 # --- End Language Configuration ---
 
-def extract_chat_history_to_json(html_file_path, json_file_path):
-    chat_history = []
+# --- Instrumentation ---
+class Metrics:
+    """Stage timers and counters for one extraction, kept apart from the localized messages.
 
-    if not os.path.exists(html_file_path):
-        print(TEXTS["error_html_not_found"].format(path=html_file_path))
+    Stage times are exclusive: entering a nested stage (e.g. "render" while the streaming
+    tokenizer runs) pauses the enclosing one, so the stages add up to the wall time.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self.reports = {} # report() kind -> number of times it was emitted
+        self.stack = []
+        self.memory = None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        now = time.perf_counter()
+        if self.stack:
+            outer, started = self.stack[-1]
+            self.stages[outer] = self.stages.get(outer, 0.0) + now - started
+        self.stack.append((name, now))
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            name, started = self.stack.pop()
+            self.stages[name] = self.stages.get(name, 0.0) + now - started
+            if self.stack:
+                self.stack[-1] = (self.stack[-1][0], now)
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def merge(self, other, prefix=""):
+        """Adds the stages and counters of another run's `as_dict()`, e.g. from a worker process."""
+        for name, seconds in other["stages"].items():
+            self.stages[prefix + name] = self.stages.get(prefix + name, 0.0) + seconds
+        for name, amount in other["counters"].items():
+            self.count(prefix + name, amount)
+
+    def as_dict(self):
+        result = {
+            "stages": {name: round(seconds, 6) for name, seconds in self.stages.items()},
+            "counters": dict(self.counters),
+            "reports": dict(self.reports),
+        }
+        if self.memory is not None:
+            result["memory"] = self.memory
+        return result
+
+@contextlib.contextmanager
+def capture_profile(profile_path=None, trace_memory=False):
+    """Optionally runs the body under cProfile (stats dumped to `profile_path`) and tracemalloc.
+
+    The tracemalloc peak and the top allocation sites are stored in the current Metrics.
+    """
+    profiler = None
+    if trace_memory:
+        import tracemalloc
+        tracemalloc.start()
+    if profile_path:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+        if trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics('lineno')[:10]
+            tracemalloc.stop()
+            current_metrics().memory = {
+                "tracemalloc_peak_bytes": peak,
+                "tracemalloc_current_bytes": current,
+                "top_allocations": [{"site": str(stat.traceback), "bytes": stat.size} for stat in top],
+            }
+
+def metrics_record(input_path, output_path, parser, mode, output_format, count, seconds, metrics):
+    """One JSON Lines record: what was extracted and how, followed by the stage/counter breakdown."""
+    return {
+        "input": input_path,
+        "output": output_path,
+        "parser": parser,
+        "mode": mode,
+        "format": output_format,
+        "messages": count or 0,
+        "seconds": round(seconds, 6),
+        **metrics,
+    }
+
+def emit_metrics(record, destination):
+    """Writes one metrics record as a JSON line to `destination` (a file path, or "-" for stderr)."""
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    if destination == "-":
+        sys.stderr.write(line)
+    else:
+        with open(destination, 'a', encoding='utf-8') as f:
+            f.write(line)
+# --- End Instrumentation ---
+
+# --- Parser Backends ---
+DEFAULT_PARSER = "html.parser"
+
+# Text inside these elements is not part of BeautifulSoup's get_text(), so native backends skip it too.
+NON_TEXT_TAGS = ("script", "style", "template")
+
+def is_turn_testid(value):
+    return bool(value) and value.startswith('conversation-turn-')
+
+class SoupBackend:
+    """BeautifulSoup with the pure-Python html.parser tree builder (the reference backend)."""
+    name = "html.parser"
+
+    def require(self):
+        import bs4 # noqa: F401
+
+    def parse(self, html_content):
+        from bs4 import BeautifulSoup
+        return BeautifulSoup(html_content, 'html.parser')
+
+    def find_turns(self, document):
+        return document.find_all('article', attrs={'data-testid': is_turn_testid})
+
+    def find_message_containers(self, document):
+        return document.find_all('div', attrs={'data-message-author-role': True})
+
+class LxmlNode:
+    """Exposes the subset of the bs4 Tag API used by the formatters on top of an lxml element.
+
+    Lookups are translated to XPath once per distinct query and evaluated by libxml2.
+    """
+    __slots__ = ("el",)
+    compiled = {}
+    TEXT_XPATH = ".//text()[not(" + " or ".join(f"parent::{tag}" for tag in NON_TEXT_TAGS) + ")]"
+
+    def __init__(self, el):
+        self.el = el
+
+    def __eq__(self, other):
+        return isinstance(other, LxmlNode) and self.el is other.el
+
+    def __hash__(self):
+        return id(self.el)
+
+    @property
+    def name(self):
+        return self.el.tag
+
+    def get(self, key, default=None):
+        value = self.el.get(key)
+        if value is None:
+            return default
+        return value.split() if key == 'class' else value
+
+    @classmethod
+    def xpath(cls, query):
+        compiled = cls.compiled.get(query)
+        if compiled is None:
+            from lxml import etree
+            compiled = cls.compiled[query] = etree.XPath(query)
+        return compiled
+
+    def find(self, name, attrs=None, class_=None):
+        predicates = []
+        for key, value in (attrs or {}).items():
+            predicates.append(f"[@{key}]" if value is True else f"[@{key}={json.dumps(value)}]")
+        if class_:
+            predicates.append(f'[contains(concat(" ", normalize-space(@class), " "), " {class_} ")]')
+        matches = self.xpath(f".//{name}{''.join(predicates)}")(self.el)
+        return LxmlNode(matches[0]) if matches else None
+
+    def child_nodes(self):
+        if self.el.text:
+            yield self.el.text
+        for child in self.el:
+            if isinstance(child.tag, str): # Skips comments and processing instructions
+                yield LxmlNode(child)
+            if child.tail:
+                yield child.tail
+
+    def get_text(self, separator="", strip=False):
+        strings = self.xpath(self.TEXT_XPATH)(self.el)
+        if strip:
+            strings = [s for s in (s.strip() for s in strings) if s]
+        return separator.join(strings)
+
+class LxmlBackend:
+    """lxml (libxml2) tree with compiled XPath turn discovery."""
+    name = "lxml"
+
+    TURN_XPATH = '//article[starts-with(@data-testid, "conversation-turn-")]'
+    CONTAINER_XPATH = '//div[@data-message-author-role]'
+
+    def require(self):
+        import lxml.html # noqa: F401 -- optional dependency, raises ImportError if missing
+
+    def parse(self, html_content):
+        import lxml.html
+        parser = lxml.html.HTMLParser(huge_tree=True) # Long code blocks exceed libxml2's default text node limit
+        return lxml.html.document_fromstring(html_content, parser=parser)
+
+    def find_turns(self, document):
+        return [LxmlNode(el) for el in LxmlNode.xpath(self.TURN_XPATH)(document)]
+
+    def find_message_containers(self, document):
+        return [LxmlNode(el) for el in LxmlNode.xpath(self.CONTAINER_XPATH)(document)]
+
+class SelectolaxNode:
+    """Exposes the subset of the bs4 Tag API used by the formatters on top of a lexbor node.
+
+    Lookups are translated to CSS selectors once per distinct query and run by lexbor.
+    """
+    __slots__ = ("node",)
+    compiled = {}
+    TEXT_SEPARATOR = "\x00" # Never survives HTML parsing, so it can delimit text fragments
+
+    def __init__(self, node):
+        self.node = node
+
+    def __eq__(self, other):
+        return isinstance(other, SelectolaxNode) and self.node.mem_id == other.node.mem_id
+
+    def __hash__(self):
+        return self.node.mem_id
+
+    @property
+    def name(self):
+        return self.node.tag
+
+    def get(self, key, default=None):
+        value = self.node.attributes.get(key, default)
+        if value is None:
+            return default
+        return value.split() if key == 'class' and isinstance(value, str) else value
+
+    def find(self, name, attrs=None, class_=None):
+        signature = (name, tuple(sorted((attrs or {}).items())), class_)
+        selector = self.compiled.get(signature)
+        if selector is None:
+            selector = name + (f".{class_}" if class_ else "")
+            for key, value in signature[1]:
+                selector += f"[{key}]" if value is True else f"[{key}={json.dumps(value)}]"
+            self.compiled[signature] = selector
+        for match in self.node.css(selector):
+            if match.mem_id != self.node.mem_id: # lexbor also tests the node itself
+                return SelectolaxNode(match)
+        return None
+
+    def child_nodes(self):
+        for child in self.node.iter(include_text=True):
+            if child.tag == '-text':
+                yield child.text_content
+            elif not child.tag.startswith('-'): # Skips comments
+                yield SelectolaxNode(child)
+
+    def get_text(self, separator="", strip=False):
+        if self.node.css_first(", ".join(NON_TEXT_TAGS)) is not None:
+            strings = [node.text_content or "" for node in self.node.traverse(include_text=True)
+                       if node.tag == '-text' and node.parent.tag not in NON_TEXT_TAGS]
+        else:
+            strings = self.node.text(deep=True, separator=self.TEXT_SEPARATOR).split(self.TEXT_SEPARATOR)
+        if strip:
+            strings = [s for s in (s.strip() for s in strings) if s]
+        return separator.join(strings)
+
+class SelectolaxBackend:
+    """selectolax (lexbor) HTML5 tree with native CSS turn discovery."""
+    name = "selectolax"
+
+    TURN_SELECTOR = 'article[data-testid^="conversation-turn-"]'
+    CONTAINER_SELECTOR = 'div[data-message-author-role]'
+
+    def require(self):
+        import selectolax.lexbor # noqa: F401 -- optional dependency, raises ImportError if missing
+
+    def parse(self, html_content):
+        from selectolax.lexbor import LexborHTMLParser
+        return LexborHTMLParser(html_content)
+
+    def find_turns(self, document):
+        return [SelectolaxNode(node) for node in document.css(self.TURN_SELECTOR)]
+
+    def find_message_containers(self, document):
+        return [SelectolaxNode(node) for node in document.css(self.CONTAINER_SELECTOR)]
+
+PARSER_BACKENDS = {
+    "html.parser": SoupBackend(),
+    "lxml": LxmlBackend(),
+    "selectolax": SelectolaxBackend(),
+}
+# --- End Parser Backends ---
+
+# --- Markdown Rendering ---
+# Handler tables are filled in at import time (see the end of this section) and can be
+# extended with register_block_handler / register_inline_handler / register_message_rule.
+TABLE_SECTION_TAGS = ('thead', 'tbody', 'tfoot')
+COPY_BUTTON_LABELS = ("copy", "edit", "copy code")
+HTML_WHITESPACE = re.compile(r"[ \t\n\r\f]+")
+SPACE_RUNS = re.compile(r" {2,}")
+SPACES_AROUND_NEWLINE = re.compile(r" *\n *")
+
+# tag name -> handler(node, previous_div) returning a Markdown block. `previous_div` is the
+# code label row (holding the language) directly before a <pre>, None for everything else.
+BLOCK_HANDLERS = {}
+# Extra tags that start a new block inside list items and blockquotes (rendered as containers)
+CONTAINER_TAGS = {'div'}
+# tag name -> handler(node, parts) appending inline Markdown to `parts`
+INLINE_HANDLERS = {}
+# data-message-author-role -> (class of the div holding the text, formatter(text_div) -> str)
+MESSAGE_RULES = {}
+
+def register_block_handler(tag_names, handler):
+    """Renders `tag_names` (direct children of div.markdown, or nested blocks) with `handler(node, previous_div)`."""
+    for name in ([tag_names] if isinstance(tag_names, str) else tag_names):
+        BLOCK_HANDLERS[name] = handler
+
+def register_inline_handler(tag_names, handler):
+    """Renders inline `tag_names` with `handler(node, parts)`, which appends Markdown to `parts`."""
+    for name in ([tag_names] if isinstance(tag_names, str) else tag_names):
+        INLINE_HANDLERS[name] = handler
+
+def register_message_rule(role, text_class, formatter):
+    """Extracts messages of `role` from the `div.<text_class>` inside its container with `formatter`."""
+    MESSAGE_RULES[role] = (text_class, formatter)
+
+def child_nodes(node):
+    """Yields the child elements and text strings of a node from any parser backend (comments skipped)."""
+    if isinstance(node, (LxmlNode, SelectolaxNode)):
+        yield from node.child_nodes()
         return
+    from bs4.element import CData, NavigableString, Tag
+    for child in node.children:
+        if isinstance(child, Tag):
+            yield child
+        elif type(child) in (NavigableString, CData):
+            yield str(child)
+
+def render_plain_text(text_div):
+    return text_div.get_text(separator='\n', strip=True)
+
+def render_markdown(text_div):
+    """Renders a `div.markdown` subtree as Markdown in a single depth-first pass.
 
+    Other <div>s are skipped; a code label row directly before a <pre> is passed to its
+    handler as `previous_div` and applies to that code block only. Each block is rendered
+    into its own list of parts and joined once, so the cost is linear in the size of the
+    subtree, including tables and code blocks with many rows.
+    """
+    blocks = []
+    previous_div = None
+    children = list(child_nodes(text_div))
+    for index, child in enumerate(children):
+        if isinstance(child, str):
+            continue
+        if child.name == 'div':
+            if is_code_label_before_pre(children, index):
+                previous_div = child
+            continue
+        handler = BLOCK_HANDLERS.get(child.name)
+        if handler is not None:
+            block = handler(child, previous_div)
+            if block:
+                blocks.append(block)
+        previous_div = None
+    return "\n\n".join(blocks)
+
+def render_nested_blocks(node):
+    """Renders the content of a list item or blockquote: runs of inline content become paragraphs.
+
+    A code label row directly before a <pre> is passed to its handler as `previous_div`, like
+    in `render_markdown`, instead of being rendered as a container.
+    """
+    blocks = []
+    inline = []
+    previous_div = None
+    children = list(child_nodes(node))
+    for index, child in enumerate(children):
+        if isinstance(child, str):
+            inline.append(child)
+            continue
+        if child.name == 'div' and is_code_label_before_pre(children, index):
+            previous_div = child
+            continue
+        handler = BLOCK_HANDLERS.get(child.name)
+        if handler is None and child.name not in CONTAINER_TAGS:
+            inline.append(child)
+            continue
+        if inline:
+            blocks.append(render_inline_nodes(inline))
+            inline = []
+        blocks.append(handler(child, previous_div) if handler is not None else "\n".join(render_nested_blocks(child)))
+        previous_div = None
+    if inline:
+        blocks.append(render_inline_nodes(inline))
+    return [block for block in blocks if block]
+
+def is_code_label_before_pre(children, index):
+    """True if `children[index]` is a code label row directly followed by a <pre> (only blank text between)."""
+    return is_code_label(children[index]) and next_element_name(children, index) == 'pre'
+
+def next_element_name(children, index):
+    """Tag name of the first element after `children[index]`, or None if non-blank text comes first."""
+    for child in children[index + 1:]:
+        if not isinstance(child, str):
+            return child.name
+        if child.strip():
+            return None
+    return None
+
+def render_paragraph(node, previous_div=None):
+    return render_inline(node)
+
+def render_heading(node, previous_div=None):
+    return "#" * int(node.name[1]) + " " + render_inline(node)
+
+def render_blockquote(node, previous_div=None):
+    text = "\n".join(render_nested_blocks(node))
+    return "\n".join(f"> {line.rstrip()}" for line in text.split("\n") if line.strip())
+
+def render_rule(node, previous_div=None):
+    return "---"
+
+def render_list(node, previous_div=None):
+    ordered = node.name == 'ol'
     try:
-        with open(html_file_path, 'r', encoding='utf-8') as f:
-            html_content = f.read()
-    except Exception as e:
-        print(TEXTS["error_reading_html"].format(error=e))
+        number = int(node.get('start', 1))
+    except (TypeError, ValueError):
+        number = 1
+    items = []
+    for li in child_nodes(node):
+        if isinstance(li, str) or li.name != 'li':
+            continue
+        marker = f"{number}. " if ordered else "- "
+        number += 1
+        text = "\n".join(render_nested_blocks(li))
+        # Continuation lines and nested lists are indented under the item's text
+        items.append((marker + text.replace("\n", "\n" + " " * len(marker))).rstrip())
+    return "\n".join(items)
+
+def render_table(node, previous_div=None):
+    header_rows = []
+    body_rows = []
+    for child in child_nodes(node):
+        if isinstance(child, str):
+            continue
+        if child.name in TABLE_SECTION_TAGS:
+            rows = header_rows if child.name == 'thead' else body_rows
+            rows.extend(row for row in child_nodes(child) if not isinstance(row, str) and row.name == 'tr')
+        elif child.name == 'tr':
+            body_rows.append(child)
+    if header_rows:
+        header_row = header_rows[0]
+    elif body_rows:
+        header_row, body_rows = body_rows[0], body_rows[1:]
+    else:
+        return ""
+
+    lines = []
+    header = render_table_cells(header_row)
+    if header:
+        lines.append("| " + " | ".join(header) + " |")
+        lines.append("| " + " | ".join(["---"] * len(header)) + " |")
+    for row in body_rows:
+        cells = render_table_cells(row)
+        if cells:
+            lines.append("| " + " | ".join(cells) + " |")
+    return "\n".join(lines)
+
+def render_table_cells(row):
+    return [render_inline(cell).replace("\n", " ").replace("|", "\\|")
+            for cell in child_nodes(row) if not isinstance(cell, str) and cell.name in ('th', 'td')]
+
+def render_code_block(pre, previous_div=None):
+    code = pre.find('code')
+    content = (code if code is not None else pre).get_text().strip()
+    fence = "````" if "```" in content else "```"
+    return f"{fence}{code_language(previous_div)}\n{content}\n{fence}"
+
+def code_language(label_div):
+    """Reads the language from the label row ChatGPT renders above a code block ("text" if absent)."""
+    if label_div is None or not is_code_label(label_div):
+        return "text"
+    div_texts = [] # Text of every nested <div>, in document order
+    collect_div_texts(label_div, div_texts)
+    for text in reversed(div_texts):
+        if text and text.lower() not in COPY_BUTTON_LABELS:
+            return text
+    return "text"
+
+def is_code_label(div):
+    classes = div.get('class', [])
+    return 'flex' in classes and 'items-center' in classes
+
+def collect_div_texts(node, div_texts):
+    pieces = []
+    for child in child_nodes(node):
+        if isinstance(child, str):
+            stripped = child.strip()
+            if stripped:
+                pieces.append(stripped)
+        elif child.name not in NON_TEXT_TAGS:
+            slot = len(div_texts)
+            if child.name == 'div':
+                div_texts.append(None)
+            text = collect_div_texts(child, div_texts)
+            if child.name == 'div':
+                div_texts[slot] = text
+            pieces.append(text)
+    return "".join(pieces)
+
+def render_inline(node):
+    return render_inline_nodes(child_nodes(node))
+
+def render_inline_nodes(nodes):
+    parts = []
+    for node in nodes:
+        append_inline(node, parts)
+    text = SPACES_AROUND_NEWLINE.sub("\n", SPACE_RUNS.sub(" ", "".join(parts)))
+    return text.strip()
+
+def append_inline(node, parts):
+    if isinstance(node, str):
+        parts.append(HTML_WHITESPACE.sub(" ", node))
         return
+    handler = INLINE_HANDLERS.get(node.name)
+    if handler is not None:
+        handler(node, parts)
+    else:
+        for child in child_nodes(node):
+            append_inline(child, parts)
 
-    soup = BeautifulSoup(html_content, 'html.parser')
-    turns = soup.find_all('article', attrs={'data-testid': lambda x: x and x.startswith('conversation-turn-')})
+def skip_inline(node, parts):
+    pass
 
-    if not turns:
-        print(TEXTS["no_turns_found"])
-        print(TEXTS["check_html_structure"])
-        print(TEXTS["attempting_direct_find"])
-        message_containers = soup.find_all('div', attrs={'data-message-author-role': True})
-        if message_containers:
-            print(TEXTS["found_direct_containers"].format(count=len(message_containers)))
-            for container in message_containers:
-                role = container.get('data-message-author-role')
-                text_div = container.find('div', class_='whitespace-pre-wrap') # User messages
-                if not text_div:
-                     text_div = container.find('div', class_='markdown') # Assistant messages
-
-                if text_div:
-                    # Simplified text extraction for direct containers for now
-                    # Complex markdown parsing like in article turns can be added if needed
-                    text_content = ""
-                    if role == "user":
-                        text_content = text_div.get_text(separator='\n', strip=True)
-                    elif role == "assistant":
-                        parts = []
-                        for element in text_div.find_all(['p', 'pre', 'ul', 'ol', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'blockquote', 'table', 'hr'], recursive=False):
-                            if element.name == 'pre':
-                                code_tag = element.find('code')
-                                lang_container = element.find_previous_sibling('div')
-                                lang = "text"
-                                if lang_container and 'flex' in lang_container.get('class', []) and 'items-center' in lang_container.get('class', []):
-                                    lang_div_candidates = lang_container.find_all('div')
-                                    if lang_div_candidates:
-                                        for candidate_div in reversed(lang_div_candidates):
-                                            div_text = candidate_div.get_text(strip=True)
-                                            if div_text and div_text.lower() not in ["copy", "edit", "copy code"]:
-                                                lang = div_text
-                                                break
-                                code_content = code_tag.get_text(strip=True) if code_tag else element.get_text(strip=True)
-                                parts.append(f"```{lang}\n{code_content}\n```")
-                            elif element.name in ['ul', 'ol']:
-                                list_items = ""
-                                for item_index, li in enumerate(element.find_all('li', recursive=False)):
-                                    prefix = "- " if element.name == 'ul' else f"{item_index + 1}. "
-                                    list_items += prefix + li.get_text(separator='\n  ', strip=True) + "\n"
-                                parts.append(list_items.strip())
-                            elif element.name and element.name.startswith('h') and len(element.name) > 1 and element.name[1].isdigit():
-                                level = int(element.name[1])
-                                parts.append("#" * level + " " + element.get_text(strip=True))
-                            elif element.name == 'blockquote':
-                                quote_lines = element.get_text(separator='\n', strip=True).split('\n')
-                                formatted_quote = "\n".join([f"> {line}" for line in quote_lines])
-                                parts.append(formatted_quote)
-                            elif element.name == 'table':
-                                table_md = ""
-                                header_row = element.find('thead')
-                                if not header_row:
-                                    header_row = element.find('tr')
-
-                                if header_row:
-                                    header_tags = header_row.find_all(['th', 'td'])
-                                    header = [th.get_text(strip=True) for th in header_tags]
-                                    if header:
-                                        table_md += "| " + " | ".join(header) + " |\n"
-                                        table_md += "| " + " | ".join(["---"] * len(header)) + " |\n"
-                                
-                                body_rows_container = element.find('tbody')
-                                if not body_rows_container:
-                                    body_rows_container = element
-                                
-                                rows_to_process = body_rows_container.find_all('tr', recursive=False)
-                                if header_row and header_row.find_parent('tbody') is None and header_row in rows_to_process :
-                                     if rows_to_process and rows_to_process[0] == header_row:
-                                        rows_to_process = rows_to_process[1:]
-
-                                for row_idx, row_item in enumerate(rows_to_process):
-                                    # Avoid reprocessing the header row if it was caught without a thead
-                                    if not element.find('thead') and row_idx == 0 and row_item == header_row:
-                                        continue
-                                    cols = [td.get_text(strip=True) for td in row_item.find_all('td', recursive=False)]
-                                    if cols:
-                                        table_md += "| " + " | ".join(cols) + " |\n"
-                                parts.append(table_md.strip())
-                            elif element.name == 'hr':
-                                parts.append("\n---\n")
-                            elif element.name == 'p':
-                                parts.append(element.get_text(strip=True))
-                        
-                        text_content_parts = []
-                        for i, part in enumerate(parts):
-                            if part.strip(): # Add non-empty parts
-                                text_content_parts.append(part.strip())
-                        text_content = "\n\n".join(text_content_parts) # Join with double newlines for markdown paragraphs
-
-                    if role and text_content is not None: # Check for not None, as empty string is valid
-                        speaker_val = "user" if role == "user" else "assistant"
-                        chat_history.append({"speaker": speaker_val, "text": text_content})
-                else:
-                    print(TEXTS["could_not_find_text_for_role"].format(role=role))
-        else:
-            print(TEXTS["no_direct_containers_found"])
+def append_line_break(node, parts):
+    parts.append("\n")
+
+def append_inline_code(node, parts):
+    text = HTML_WHITESPACE.sub(" ", node.get_text()).strip()
+    if text:
+        parts.append(f"`{text}`" if "`" not in text else f"`` {text} ``")
+
+def wrap_inline(render):
+    """Builds an inline handler that renders the children and lets `render(node, text)` decorate them.
+
+    Whitespace at the edges stays outside the decoration, so `a<b> x </b>b` becomes `a **x** b`.
+    """
+    def handler(node, parts):
+        inner = []
+        for child in child_nodes(node):
+            append_inline(child, inner)
+        raw = "".join(inner)
+        text = raw.strip()
+        if not text:
+            parts.append(raw)
+            return
+        leading = raw[:len(raw) - len(raw.lstrip())]
+        trailing = raw[len(raw.rstrip()):]
+        parts.append(leading + render(node, text) + trailing)
+    return handler
+
+def render_link(node, text):
+    href = node.get('href')
+    return f"[{text}]({href})" if href else text
+
+register_block_handler('p', render_paragraph)
+register_block_handler(('h1', 'h2', 'h3', 'h4', 'h5', 'h6'), render_heading)
+register_block_handler(('ul', 'ol'), render_list)
+register_block_handler('pre', render_code_block)
+register_block_handler('blockquote', render_blockquote)
+register_block_handler('table', render_table)
+register_block_handler('hr', render_rule)
+
+register_inline_handler(NON_TEXT_TAGS, skip_inline)
+register_inline_handler('br', append_line_break)
+register_inline_handler('code', append_inline_code)
+register_inline_handler(('strong', 'b'), wrap_inline(lambda node, text: f"**{text}**"))
+register_inline_handler(('em', 'i'), wrap_inline(lambda node, text: f"*{text}*"))
+register_inline_handler('a', wrap_inline(render_link))
+
+register_message_rule("user", "whitespace-pre-wrap", render_plain_text)
+register_message_rule("assistant", "markdown", render_markdown)
+# --- End Markdown Rendering ---
+
+def extract_container_message(container, index):
+    """Formats a `data-message-author-role` container as a message dict, or returns None.
+
+    Shared by both discovery strategies: the `conversation-turn-N` articles and the
+    fallback that looks for role containers directly. `index` is 0-based.
+    """
+    role = container.get('data-message-author-role')
+    rule = MESSAGE_RULES.get(role)
+    if rule is None:
+        report("could_not_find_text_for_role", role=role)
+        return None
+    text_class, formatter = rule
+    text_div = container.find('div', class_=text_class)
+    if text_div is None:
+        report("warning_no_text_content", speaker=role, index=index + 1)
+        return None
+    return {
+        "speaker": role,
+        "text": formatter(text_div)
+    }
+
+def extract_turn_message(turn, turn_index):
+    """Formats one `conversation-turn-N` <article> as a message dict, or returns None."""
+    for role in MESSAGE_RULES:
+        container = turn.find('div', attrs={'data-message-author-role': role})
+        if container is not None:
+            return extract_container_message(container, turn_index)
+    return None
+
+# --- Output Writers ---
+OUTPUT_FORMATS = {"json": ".json", "jsonl": ".jsonl"} # Format -> default file extension
+DEFAULT_FORMAT = "json"
+OUTPUT_BUFFER_SIZE = 1024 * 1024 # Bytes buffered before each write to disk (no fsync)
+
+ORJSON = None # The orjson module once imported, False if it is not installed
+
+def load_orjson():
+    """Imports orjson on first use: an optional fast path that produces the same bytes as the json module here."""
+    global ORJSON
+    if ORJSON is None:
+        try:
+            import orjson
+            ORJSON = orjson
+        except ImportError:
+            ORJSON = False
+    return ORJSON
+
+def encode_message(message, indent=None):
+    """`message` as UTF-8 JSON, indented by `indent` spaces per level or compact if None."""
+    orjson = ORJSON if ORJSON is not None else load_orjson()
+    if orjson and indent in (None, 2): # The only indentation orjson supports
+        try:
+            return orjson.dumps(message, option=orjson.OPT_INDENT_2 if indent else 0)
+        except TypeError: # e.g. lone surrogates, which orjson rejects; let the json module report them
+            pass
+    if indent is not None:
+        return json.dumps(message, ensure_ascii=False, indent=indent).encode('utf-8')
+    return json.dumps(message, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def temporary_output_path(path, owner):
+    """A hidden file next to `path` (same directory, so the final rename stays on one file system)."""
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.{os.getpid()}-{id(owner):x}.tmp")
+
+def write_json_atomically(path, data):
+    """Writes `data` as indented JSON to a temporary file and renames it over `path`."""
+    temp_path = temporary_output_path(path, data)
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temp_path)
+        raise
+
+class MessageWriter:
+    """Writes messages to disk as soon as they are extracted, through a large write buffer.
+
+    The file is only created when the first message arrives, so an empty extraction
+    leaves no output behind. Messages go to a temporary file that is renamed over the
+    output once complete, so readers never see a partial file and a failed extraction
+    keeps the previous output. `count`, `bytes_written` and the first and last message
+    are recorded while writing, so callers never have to read the output back.
+    """
+    header = b""
+    separator = b""
+    footer = b""
+    indent = None # Spaces per nesting level (messages sit one level deep); None writes each message compactly
+
+    def __init__(self, json_file_path):
+        self.json_file_path = json_file_path
+        self.temp_path = temporary_output_path(json_file_path, self)
+        self.file = None
+        self.count = 0
+        self.bytes_written = 0
+        self.first_message = None
+        self.last_message = None
+        self.error = None
+        self.metrics = current_metrics()
+
+    def encode(self, message):
+        if self.indent is None:
+            return encode_message(message)
+        padding = b" " * self.indent
+        return padding + encode_message(message, self.indent).replace(b"\n", b"\n" + padding)
+
+    def emit(self, data):
+        self.file.write(data)
+        self.bytes_written += len(data)
+
+    def write(self, message):
+        if self.error is not None:
+            return
+        try:
+            if self.file is None:
+                self.file = open(self.temp_path, 'wb', buffering=OUTPUT_BUFFER_SIZE)
+                self.emit(self.header)
+            else:
+                self.emit(self.separator)
+            self.emit(self.encode(message))
+        except Exception as e:
+            self.error = e
+            return
+        if self.count == 0:
+            self.first_message = message
+        self.last_message = message
+        self.count += 1
+        self.metrics.count("messages_emitted")
+
+    def close(self, discard=False):
+        """Completes the output, or with `discard` (extraction failed) drops it and keeps the previous file."""
+        if self.file is None:
             return
+        try:
+            if self.error is None and not discard:
+                self.emit(self.footer)
+            self.file.close()
+            if self.error is None and not discard:
+                os.replace(self.temp_path, self.json_file_path)
+        except Exception as e:
+            self.error = self.error or e
+        self.file = None
+        if self.error is not None or discard:
+            with contextlib.suppress(OSError):
+                os.remove(self.temp_path)
+
+    def finish(self):
+        """Closes the file and reports the outcome. Returns the message count, or None if nothing was written."""
+        self.close()
+        self.metrics.count("bytes_out", self.bytes_written)
+        if self.error is not None:
+            report("error_writing_json", error=self.error)
+        elif not self.count:
+            report("no_history_extracted")
+        else:
+            report("history_extracted_success", path=self.json_file_path)
+            return self.count
+
+class JSONArrayWriter(MessageWriter):
+    """Streams a JSON array with the same bytes as `json.dump(messages, f, ensure_ascii=False, indent=2)`."""
+    header = b"[\n"
+    separator = b",\n"
+    footer = b"\n]"
+    indent = 2
+
+class JSONLinesWriter(MessageWriter):
+    """Streams one compact JSON object per line (JSON Lines)."""
+    separator = b"\n"
+    footer = b"\n"
+
+MESSAGE_WRITERS = {
+    "json": JSONArrayWriter,
+    "jsonl": JSONLinesWriter,
+}
+
+def default_output_path(html_file_path, output_format=DEFAULT_FORMAT):
+    return os.path.splitext(html_file_path)[0] + OUTPUT_FORMATS[output_format]
+# --- End Output Writers ---
+
+# --- Export Sources ---
+ENCODING_SNIFF_BYTES = 1024 # Bytes searched for a byte order mark or <meta charset>
+BYTE_ORDER_MARKS = (
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "utf-16-be"),
+)
+META_CHARSET = re.compile(rb'<meta[^>]*?charset\s*=\s*["\']?\s*([A-Za-z0-9_.:-]+)', re.IGNORECASE)
+
+def sniff_encoding(data):
+    """Returns (encoding, BOM length) from a byte order mark or a <meta charset> in the first 1 KB.
+
+    Like browsers, a UTF-16 label in <meta> is read as UTF-8, and UTF-8 is the default.
+    """
+    head = bytes(data[:ENCODING_SNIFF_BYTES])
+    for mark, encoding in BYTE_ORDER_MARKS:
+        if head.startswith(mark):
+            return encoding, len(mark)
+    match = META_CHARSET.search(head)
+    if match:
+        try:
+            encoding = codecs.lookup(match.group(1).decode('ascii')).name
+        except LookupError:
+            encoding = None
+        if encoding and not encoding.startswith("utf-16"):
+            return encoding, 0
+    return "utf-8", 0
+
+class ExportSource:
+    """A chat export given as a path, as bytes, or as a binary or text file object.
+
+    Bytes are decoded with universal newlines in the encoding of their byte order mark or
+    <meta charset> (see `sniff_encoding`), or in `encoding` if given; text file objects are
+    read as they are. Every extraction mode decodes the same way. The source can be opened
+    a second time for the streaming fallback pass (file objects are rewound, which
+    requires them to be seekable).
+    """
+
+    def __init__(self, source, encoding=None):
+        self.source = source
+        self.encoding = encoding
+        self.is_file_object = hasattr(source, 'read')
+        self.start = None
+        if self.is_file_object and getattr(source, 'seekable', lambda: False)():
+            self.start = source.tell()
+        self.opened = False
+
+    def decoded(self, raw, head):
+        """Wraps the binary stream `raw`, positioned at the start, skipping the BOM found in `head`."""
+        encoding, offset = (self.encoding, 0) if self.encoding else sniff_encoding(head)
+        if offset:
+            raw.read(offset)
+        return io.TextIOWrapper(raw, encoding=encoding)
+
+    def size(self):
+        """Size in bytes, or None for file objects."""
+        if isinstance(self.source, (bytes, bytearray, memoryview)):
+            return len(self.source)
+        if self.is_file_object:
+            return None
+        return os.path.getsize(self.source)
+
+    @contextlib.contextmanager
+    def open(self):
+        if self.is_file_object:
+            if self.opened:
+                if self.start is None:
+                    raise io.UnsupportedOperation("the export file object cannot be read twice (not seekable)")
+                self.source.seek(self.start)
+            self.opened = True
+            if isinstance(self.source, io.TextIOBase):
+                yield self.source
+                return
+            if self.encoding:
+                head = b""
+            elif self.start is not None:
+                head = self.source.read(ENCODING_SNIFF_BYTES)
+                self.source.seek(self.start)
+            else: # Unseekable: look ahead in the read buffer if there is one
+                head = getattr(self.source, 'peek', lambda size: b"")(ENCODING_SNIFF_BYTES)
+            stream = self.decoded(self.source, head)
+            try:
+                yield stream
+            finally:
+                stream.detach() # Leave the caller's file object open
+        elif isinstance(self.source, (bytes, bytearray, memoryview)):
+            yield self.decoded(io.BytesIO(self.source), self.source)
+        else:
+            with open(self.source, 'rb') as f:
+                head = f.read(ENCODING_SNIFF_BYTES)
+                f.seek(0)
+                with self.decoded(f, head) as stream:
+                    yield stream
+
+    def read(self):
+        metrics = current_metrics()
+        with metrics.stage("read"):
+            with self.open() as f:
+                html_content = f.read()
+        size = self.size()
+        if size is not None:
+            metrics.count("bytes_in", size)
+        return html_content
+# --- End Export Sources ---
+
+def iter_document_messages(html_content, backend):
+    """Yields the messages of a whole parsed export.
+
+    Returns False (as the generator's return value) if neither conversation turns nor
+    role containers were found, True otherwise.
+    """
+    metrics = current_metrics()
+    with metrics.stage("parse"):
+        document = backend.parse(html_content)
+    with metrics.stage("discover"):
+        turns = backend.find_turns(document)
+    metrics.count("turns_found", len(turns))
+
+    if not turns:
+        report("no_turns_found")
+        report("check_html_structure")
+        report("attempting_direct_find")
+        with metrics.stage("discover"):
+            message_containers = backend.find_message_containers(document)
+        metrics.count("containers_found", len(message_containers))
+        if not message_containers:
+            report("no_direct_containers_found")
+            return False
+        report("found_direct_containers", count=len(message_containers))
+        for index, container in enumerate(message_containers):
+            with metrics.stage("render"):
+                message = extract_container_message(container, index)
+            if message is not None:
+                yield message
 
     # This `for` loop is the primary extraction logic if `turns` were found
     for turn_index, turn in enumerate(turns):
-        user_message_div = turn.find('div', attrs={'data-message-author-role': 'user'})
-        assistant_message_div = turn.find('div', attrs={'data-message-author-role': 'assistant'})
-
-        speaker = None
-        text_content = None # Initialize to None
-
-        if user_message_div:
-            speaker = "user"
-            text_div = user_message_div.find('div', class_='whitespace-pre-wrap')
-            if text_div:
-                text_content = text_div.get_text(separator='\n', strip=True)
-        elif assistant_message_div:
-            speaker = "assistant"
-            text_div = assistant_message_div.find('div', class_='markdown')
-            if text_div:
-                parts = []
-                for element in text_div.find_all(['p', 'pre', 'ul', 'ol', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'blockquote', 'table', 'hr'], recursive=False):
-                    if element.name == 'pre':
-                        code_tag = element.find('code')
-                        lang_container = element.find_previous_sibling('div')
-                        lang = "text"
-                        if lang_container and 'flex' in lang_container.get('class', []) and 'items-center' in lang_container.get('class', []):
-                            lang_div_candidates = lang_container.find_all('div')
-                            if lang_div_candidates:
-                                for candidate_div in reversed(lang_div_candidates):
-                                    div_text = candidate_div.get_text(strip=True)
-                                    if div_text and div_text.lower() not in ["copy", "edit", "copy code"]: # More specific check
-                                        lang = div_text
-                                        break
-                        code_content = code_tag.get_text(strip=True) if code_tag else element.get_text(strip=True)
-                        parts.append(f"```{lang}\n{code_content}\n```")
-                    elif element.name in ['ul', 'ol']:
-                        list_items = ""
-                        for item_index, li in enumerate(element.find_all('li', recursive=False)):
-                            prefix = "- " if element.name == 'ul' else f"{item_index + 1}. "
-                            list_items += prefix + li.get_text(separator='\n  ', strip=True) + "\n"
-                        parts.append(list_items.strip())
-                    elif element.name and element.name.startswith('h') and len(element.name) > 1 and element.name[1].isdigit():
-                        level = int(element.name[1])
-                        parts.append("#" * level + " " + element.get_text(strip=True))
-                    elif element.name == 'blockquote':
-                        quote_lines = element.get_text(separator='\n', strip=True).split('\n')
-                        formatted_quote = "\n".join([f"> {line.strip()}" for line in quote_lines if line.strip()]) # Add > to each line
-                        parts.append(formatted_quote)
-                    elif element.name == 'table':
-                        table_md = ""
-                        header_row = element.find('thead')
-                        if not header_row: # if no thead, try finding first tr as header
-                            header_row = element.find('tr')
-
-                        if header_row:
-                            header_tags = header_row.find_all(['th', 'td'])
-                            header = [th.get_text(strip=True) for th in header_tags]
-                            if header:
-                                table_md += "| " + " | ".join(header) + " |\n"
-                                table_md += "| " + " | ".join(["---"] * len(header)) + " |\n"
-                        
-                        body_rows_container = element.find('tbody')
-                        if not body_rows_container: # if no tbody, use all trs
-                            body_rows_container = element
-                        
-                        rows_to_process = body_rows_container.find_all('tr', recursive=False) # Get only direct children trs
-                        
-                        # Avoid reprocessing the header row if it was already handled (e.g. no thead tag present)
-                        if header_row and header_row.find_parent('tbody') is None and header_row in rows_to_process:
-                             if rows_to_process and rows_to_process[0] == header_row:
-                                rows_to_process = rows_to_process[1:]
-
-
-                        for row_item in rows_to_process:
-                            cols = [td.get_text(strip=True) for td in row_item.find_all('td', recursive=False)] # direct children td
-                            if cols: # only if row has columns
-                                table_md += "| " + " | ".join(cols) + " |\n"
-                        parts.append(table_md.strip())
-                    elif element.name == 'hr':
-                        parts.append("\n---\n")
-                    elif element.name == 'p': # Explicitly handle paragraphs
-                         parts.append(element.get_text(strip=True))
-                
-                # Join parts, ensure non-empty parts are joined with double newlines
-                text_content_parts = []
-                for i, part in enumerate(parts):
-                    if part.strip(): # Add non-empty parts
-                        text_content_parts.append(part.strip())
-                text_content = "\n\n".join(text_content_parts)
-
-        if speaker and text_content is not None: # Allow empty string as valid content
-            chat_history.append({
-                "speaker": speaker,
-                "text": text_content
-            })
-        elif speaker and text_content is None: # Only print warning if speaker was identified but no text
-             print(TEXTS["warning_no_text_content"].format(speaker=speaker, index=turn_index + 1))
-
-    if not chat_history:
-        print(TEXTS["no_history_extracted"])
+        with metrics.stage("render"):
+            message = extract_turn_message(turn, turn_index)
+        if message is not None:
+            yield message
+    return True
+
+def iter_export_messages(export, backend):
+    return (yield from iter_document_messages(export.read(), backend))
+
+def write_messages(messages, writer):
+    """Writes every message produced by the `messages` generator and returns its return value.
+
+    If the generator raises, the partial output is discarded before the error propagates.
+    """
+    metrics = current_metrics()
+    while True:
+        try:
+            message = next(messages)
+        except StopIteration as stop:
+            return stop.value
+        except BaseException:
+            writer.close(discard=True)
+            raise
+        with metrics.stage("serialize"):
+            writer.write(message)
+
+def write_extraction(html_file_path, json_file_path, parser, output_format, writer, messages):
+    """Writes the messages of one export, shared by every extraction mode.
+
+    `messages(backend)` returns the mode's message generator. Messages are written as
+    soon as they are formatted, through `writer` (by default a `MessageWriter` for
+    `output_format`). Read errors are reported as `error_reading_html` and anything else
+    as `error_unexpected`; either way the partial output is discarded. Returns the number
+    of messages written, or None if nothing was written.
+    """
+    if not os.path.exists(html_file_path):
+        report("error_html_not_found", path=html_file_path)
+        return
+
+    backend = PARSER_BACKENDS[parser]
+    try:
+        backend.require()
+    except ImportError as e:
+        report("error_parser_unavailable", parser=parser, error=e)
+        return
+
+    if writer is None:
+        writer = MESSAGE_WRITERS[output_format](json_file_path)
+    try:
+        found = write_messages(messages(backend), writer) # Discards the output if it raises
+    except (OSError, UnicodeDecodeError) as e:
+        report("error_reading_html", error=e)
+        return
+    except Exception as e: # A bug in a renderer, or a crashed worker process
+        report("error_unexpected", path=html_file_path, error=e)
+        return
+    if not found:
+        return
+    with current_metrics().stage("serialize"):
+        return writer.finish()
+
+def extract_chat_history_to_json(html_file_path, json_file_path, parser=DEFAULT_PARSER, output_format=DEFAULT_FORMAT,
+                                 writer=None):
+    """Extracts the chat from `html_file_path` into `json_file_path` (see `write_extraction`)."""
+    return write_extraction(html_file_path, json_file_path, parser, output_format, writer,
+                            lambda backend: iter_export_messages(ExportSource(html_file_path), backend))
+
+# --- Streaming Extraction ---
+STREAM_CHUNK_SIZE = 1024 * 1024 # Characters fed to the incremental parser per read
+
+def is_conversation_turn(tag, attrs):
+    if tag != 'article':
+        return False
+    return is_turn_testid(dict(attrs).get('data-testid'))
+
+def is_message_container(tag, attrs):
+    return tag == 'div' and 'data-message-author-role' in dict(attrs)
+
+class SubtreeStreamParser(HTMLParser):
+    """Incremental parser that re-emits the markup of every element accepted by `match`.
+
+    Only the subtree currently being captured is held in memory; everything else is
+    discarded as soon as it has been tokenized. `on_subtree` receives the captured
+    markup of each match in document order, nested matches included (like `find_all`);
+    `on_match` is called for every matching start tag.
+    """
+
+    def __init__(self, match, on_subtree, on_match=None):
+        super().__init__(convert_charrefs=False) # Same tokenization as bs4's html.parser builder
+        self.match = match
+        self.on_subtree = on_subtree
+        self.on_match = on_match
+        self.parts = None # Markup of the outermost open match; nested matches are slices of it
+        self.open = [] # [tag, depth, index of the start tag in `parts`, slot] of every open match
+        self.slots = collections.deque() # [markup, None while still open] of every match, in document order
+
+    def flush(self):
+        """Emits the completed matches that no enclosing, still open match is holding back."""
+        while self.slots and self.slots[0][0] is not None:
+            self.on_subtree(self.slots.popleft()[0])
+
+    def handle_starttag(self, tag, attrs):
+        matched = self.match(tag, attrs)
+        if matched and self.on_match:
+            self.on_match()
+        if self.parts is not None:
+            self.parts.append(self.get_starttag_text())
+            for capture in self.open:
+                if tag == capture[0]:
+                    capture[1] += 1
+        elif matched:
+            self.parts = [self.get_starttag_text()]
+        if matched:
+            slot = [None]
+            self.slots.append(slot)
+            self.open.append([tag, 1, len(self.parts) - 1, slot])
+
+    def handle_startendtag(self, tag, attrs):
+        matched = self.match(tag, attrs)
+        if matched and self.on_match:
+            self.on_match()
+        text = self.get_starttag_text()
+        if self.parts is not None:
+            self.parts.append(text)
+        if matched: # bs4 turns a self-closing tag into an (empty) element
+            self.slots.append([f"{text}</{tag}>"])
+            self.flush()
+
+    def handle_endtag(self, tag):
+        if self.parts is None:
+            return
+        self.parts.append(f"</{tag}>")
+        closed = False
+        for capture in self.open:
+            if tag == capture[0]:
+                capture[1] -= 1
+                if not capture[1]:
+                    capture[3][0] = "".join(self.parts[capture[2]:])
+                    closed = True
+        if closed:
+            self.open = [capture for capture in self.open if capture[1]]
+            if not self.open:
+                self.parts = None
+            self.flush()
+
+    def handle_data(self, data):
+        if self.parts is not None:
+            self.parts.append(data)
+
+    def handle_entityref(self, name):
+        if self.parts is not None:
+            self.parts.append(f"&{name};")
+
+    def handle_charref(self, name):
+        if self.parts is not None:
+            self.parts.append(f"&#{name};")
+
+    def handle_comment(self, data):
+        if self.parts is not None:
+            self.parts.append(f"<!--{data}-->")
+
+    def handle_decl(self, decl):
+        if self.parts is not None:
+            self.parts.append(f"<!{decl}>")
+
+    def handle_pi(self, data):
+        if self.parts is not None:
+            self.parts.append(f"<?{data}>")
+
+    def unknown_decl(self, data):
+        if self.parts is not None:
+            self.parts.append(f"<![{data}]>")
+
+    def close(self):
+        """Flushes buffered input; elements still open at the end of the input are emitted as is.
+
+        Tree builders close such elements implicitly, so a truncated save still yields its last turn.
+        """
+        super().close()
+        for capture in self.open:
+            capture[3][0] = "".join(self.parts[capture[2]:])
+        self.open = []
+        self.parts = None
+        self.flush()
+
+def feed_source(source, parser, chunk_size):
+    """Feeds an `ExportSource` to `parser` chunk by chunk, yielding after every chunk."""
+    metrics = current_metrics()
+    with source.open() as f:
+        while True:
+            with metrics.stage("read"):
+                chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            with metrics.stage("tokenize"):
+                parser.feed(chunk)
+            yield
+    with metrics.stage("tokenize"):
+        parser.close()
+    yield
+
+def iter_streamed_messages(source, backend, chunk_size=STREAM_CHUNK_SIZE):
+    """Streaming counterpart of `iter_document_messages` for an `ExportSource`.
+
+    Each `conversation-turn-N` article is parsed on its own (with the selected parser
+    backend) and yielded as soon as its chunk has been tokenized, so peak memory is
+    bounded by the largest turn rather than the whole export.
+    """
+    metrics = current_metrics()
+    pending = []
+    turn_count = 0
+    container_count = 0
+
+    def on_turn(markup):
+        nonlocal turn_count
+        with metrics.stage("parse"):
+            turn = backend.find_turns(backend.parse(markup))[0]
+        with metrics.stage("render"):
+            message = extract_turn_message(turn, turn_count)
+        turn_count += 1
+        if message is not None:
+            pending.append(message)
+
+    def on_container():
+        nonlocal container_count
+        container_count += 1
+
+    # Role containers are only counted here; they are needed if no article turns exist.
+    def match(tag, attrs):
+        if is_message_container(tag, attrs):
+            on_container()
+        return is_conversation_turn(tag, attrs)
+
+    for _ in feed_source(source, SubtreeStreamParser(match, on_turn), chunk_size):
+        yield from pending
+        pending.clear()
+    size = source.size()
+    if size is not None:
+        metrics.count("bytes_in", size)
+    metrics.count("turns_found", turn_count)
+    metrics.count("containers_found", container_count)
+
+    if not turn_count:
+        report("no_turns_found")
+        report("check_html_structure")
+        report("attempting_direct_find")
+        if not container_count:
+            report("no_direct_containers_found")
+            return False
+        report("found_direct_containers", count=container_count)
+        container_index = 0
+
+        def on_container_subtree(markup):
+            nonlocal container_index
+            with metrics.stage("parse"):
+                container = backend.find_message_containers(backend.parse(markup))[0]
+            with metrics.stage("render"):
+                message = extract_container_message(container, container_index)
+            container_index += 1
+            if message is not None:
+                pending.append(message)
+
+        for _ in feed_source(source, SubtreeStreamParser(is_message_container, on_container_subtree), chunk_size):
+            yield from pending
+            pending.clear()
+    return True
+
+def stream_chat_history_to_json(html_file_path, json_file_path, chunk_size=STREAM_CHUNK_SIZE, parser=DEFAULT_PARSER,
+                                output_format=DEFAULT_FORMAT, writer=None):
+    """Streaming counterpart of `extract_chat_history_to_json` (see `iter_streamed_messages`)."""
+    return write_extraction(html_file_path, json_file_path, parser, output_format, writer,
+                            lambda backend: iter_streamed_messages(ExportSource(html_file_path), backend, chunk_size))
+# --- End Streaming Extraction ---
+
+# --- Mapped Input ---
+# Exports are located and decoded turn by turn straight from a read-only memory map:
+# the raw bytes are scanned for `conversation-turn-` articles and only each turn's slice
+# is decoded and parsed, so the whole document is never held as one (up to 4x larger) str.
+TURN_TESTID_MARKER = b'conversation-turn-'
+TURN_TESTID_PREFIXES = (b'data-testid="', b"data-testid='")
+TAG_NAME_END = (b' ', b'\t', b'\n', b'\r', b'\f', b'/', b'>')
+START_TAG_WINDOW = 64 * 1024 # Bytes searched back from a marker for the start of its <article> tag
+MAPPED_RELEASE_INTERVAL = 8 * 1024 * 1024 # Bytes processed between releases of mapped pages
+# Elements whose content the streaming tokenizer reads as plain text; markup inside them
+# (or inside comments), such as a turn in a <script> string, is not part of the page.
+RAW_TEXT_ELEMENTS = tuple(HTMLParser.CDATA_CONTENT_ELEMENTS) + tuple(getattr(HTMLParser, 'RCDATA_CONTENT_ELEMENTS', ()))
+RAW_TEXT_START = rb'<!--|<(?P<raw>' + b'|'.join(name.encode('ascii') for name in RAW_TEXT_ELEMENTS) + rb')(?=[ \t\n\r\f/>])'
+RAW_TEXT_ENDS = {name.encode('ascii'): re.compile(rb'</' + name.encode('ascii') + rb'(?=[ \t\n\r\f/>])', re.IGNORECASE)
+                 for name in RAW_TEXT_ELEMENTS}
+TURN_SCAN = re.compile(rb'(?i:' + RAW_TEXT_START + rb')|(?P<marker>' + re.escape(TURN_TESTID_MARKER) + rb')')
+ARTICLE_SCAN = re.compile(rb'(?i:' + RAW_TEXT_START + rb'|<(?P<article>/?)article(?=[ \t\n\r\f/>]))')
+def is_ascii_compatible(encoding):
+    return "a".encode(encoding) == b"a" and "<".encode(encoding) == b"<"
+
+def decode_html(raw, encoding):
+    """Decodes like a text-mode file read: strict errors, universal newlines."""
+    text = raw.decode(encoding)
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+def is_tag_at(data, position, name):
+    end = position + len(name)
+    return data[position:end].lower() == name and data[end:end + 1] in TAG_NAME_END
+
+def raw_text_end(data, match):
+    """Offset just past the comment or raw-text element opened at `match`, len(data) if it is never closed."""
+    if match.group('raw') is None:
+        end = data.find(b'-->', match.end())
+        return len(data) if end < 0 else end + 3
+    close = RAW_TEXT_ENDS[match.group('raw').lower()].search(data, match.end())
+    return len(data) if close is None else close.end()
+
+def iter_turn_offsets(data, position=0):
+    """Yields the (start, end) byte offsets of every `conversation-turn-N` <article> in `data`.
+
+    Turns come in document order, including turns nested in another one (like `find_all`),
+    and comments and raw-text elements are skipped the way the tokenizer skips them. The
+    scan only touches the bytes up to the turn it yields, so pages of a memory map can be
+    released behind it.
+    """
+    while True:
+        match = TURN_SCAN.search(data, position)
+        if match is None:
+            return
+        if match.group('marker') is None:
+            position = raw_text_end(data, match)
+            continue
+        marker = match.start()
+        position = match.end()
+        if data[max(0, marker - len(TURN_TESTID_PREFIXES[0])):marker] not in TURN_TESTID_PREFIXES:
+            continue
+        start = data.rfind(b'<', max(0, marker - START_TAG_WINDOW), marker)
+        if start < 0 or not is_tag_at(data, start, b'<article') or data.find(b'>', start, marker) >= 0:
+            continue # Text, or an attribute of some other element
+        content = data.find(b'>', marker) + 1
+        if not content:
+            return # The start tag itself is cut off, so it is text to the parsers too
+        depth = 1
+        nested = False
+        cursor = content
+        while depth:
+            tag = ARTICLE_SCAN.search(data, cursor)
+            if tag is None:
+                break
+            if tag.group('article') is None:
+                cursor = raw_text_end(data, tag)
+                continue
+            if tag.group('article'):
+                depth -= 1
+            else:
+                depth += 1
+                nested = True
+            cursor = tag.end()
+        end = data.find(b'>', cursor) if not depth else -1
+        if end < 0: # Unterminated turn (a truncated save): like the tree builders, run it to the end
+            end = len(data) - 1
+        yield start, end + 1
+        position = content if nested else end + 1 # Turns nested in this one come next
+
+@contextlib.contextmanager
+def map_source(source):
+    """Yields (raw bytes, encoding) of a path, bytes or file object, the bytes as a read-only mmap if possible.
+
+    The encoding is None (to be sniffed) except for text file objects, whose text has been
+    decoded already and is re-encoded as UTF-8.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        yield (bytes(source) if isinstance(source, memoryview) else source), None
         return
+    if hasattr(source, 'read'):
+        try:
+            fileno = source.fileno()
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            fileno = None
+        if fileno is None or isinstance(source, io.TextIOBase):
+            data = source.read()
+            if isinstance(data, str):
+                yield data.encode('utf-8'), 'utf-8'
+            else:
+                yield data, None
+        else:
+            with mapped_file(fileno) as data:
+                yield data, None
+        return
+    with open(source, 'rb') as f:
+        with mapped_file(f.fileno()) as data:
+            yield data, None
+
+@contextlib.contextmanager
+def mapped_file(fileno):
+    import mmap
+    if os.fstat(fileno).st_size == 0: # Empty files cannot be mapped
+        yield b""
+        return
+    data = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    try:
+        if hasattr(data, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+            data.madvise(mmap.MADV_SEQUENTIAL)
+        yield data
+    finally:
+        data.close()
+
+def release_mapped_pages(data, released, position):
+    """Drops the pages of `data` before `position` from the process (they stay in the page cache).
+
+    Returns the new release boundary. Without this, every page the scan has touched
+    counts towards the resident set until the map is closed.
+    """
+    import mmap
+    if not hasattr(data, 'madvise') or not hasattr(mmap, 'MADV_DONTNEED'):
+        return released
+    boundary = position - position % mmap.PAGESIZE
+    if boundary - released >= MAPPED_RELEASE_INTERVAL:
+        data.madvise(mmap.MADV_DONTNEED, released, boundary - released)
+        return boundary
+    return released
+
+def render_turn_slice(raw, encoding, backend, index):
+    """Decodes, parses and renders the bytes of one scanned turn; returns the message or None."""
+    metrics = current_metrics()
+    with metrics.stage("read"):
+        markup = decode_html(raw, encoding)
+    with metrics.stage("parse"):
+        turns = backend.find_turns(backend.parse(markup))
+    if not turns: # Not a turn to this backend after all (e.g. an <article> in a <template> for selectolax)
+        return None
+    with metrics.stage("render"):
+        return extract_turn_message(turns[0], index)
+
+def iter_mapped_messages(data, backend, encoding=None, cache=None):
+    """Yields the messages of an export held as raw bytes (usually a memory map).
+
+    Turns are located by a byte scan and decoded and parsed one at a time, with the
+    same results as the streaming extractor. The encoding is sniffed unless given.
+    With an `ExtractionCache`, turns whose bytes were rendered before are taken from the
+    cache without being decoded or parsed. Exports without turns, and encodings the
+    byte scan cannot read (UTF-16), are decoded as a whole and use the tree extractor.
+    """
+    metrics = current_metrics()
+    encoding, offset = (encoding, 0) if encoding else sniff_encoding(data)
+    metrics.count("bytes_in", len(data))
+    if not is_ascii_compatible(encoding):
+        with metrics.stage("read"):
+            html_content = decode_html(data[offset:], encoding)
+        return (yield from iter_document_messages(html_content, backend))
+
+    offsets = iter_turn_offsets(data, offset)
+    turn_count = 0
+    released = 0
+    while True:
+        with metrics.stage("scan"):
+            span = next(offsets, None)
+        if span is None:
+            break
+        start, end = span
+        raw = data[start:end]
+        message = None
+        if cache is not None:
+            with metrics.stage("cache"):
+                key = ExtractionCache.turn_key(raw, backend.name, encoding)
+                message = cache.get(key)
+            cache.stats["turn_hits" if message is not None else "turn_misses"] += 1
+        if message is None:
+            message = render_turn_slice(raw, encoding, backend, turn_count)
+            if cache is not None and message is not None:
+                with metrics.stage("cache"):
+                    cache.put(key, message)
+        turn_count += 1
+        if message is not None:
+            yield message
+        released = release_mapped_pages(data, released, start)
+    metrics.count("turns_found", turn_count)
+    if turn_count:
+        return True
+
+    with metrics.stage("read"):
+        html_content = decode_html(data[offset:], encoding)
+    return (yield from iter_document_messages(html_content, backend))
+
+def iter_mapped_source(source, backend, cache=None):
+    with map_source(source) as (data, encoding):
+        return (yield from iter_mapped_messages(data, backend, encoding, cache))
+
+def mapped_chat_history_to_json(html_file_path, json_file_path, parser=DEFAULT_PARSER, output_format=DEFAULT_FORMAT,
+                                writer=None, cache=None):
+    """Memory-mapped counterpart of `extract_chat_history_to_json` (see `iter_mapped_messages`)."""
+    return write_extraction(html_file_path, json_file_path, parser, output_format, writer,
+                            lambda backend: iter_mapped_source(html_file_path, backend, cache))
+# --- End Mapped Input ---
+
+# --- Parallel Rendering ---
+# One huge conversation is split at the turn boundaries found by the byte scan, and runs of
+# consecutive turns are rendered on a process pool. Results are consumed strictly in
+# submission order, so the output (and the status messages) match a serial run exactly.
+PARALLEL_TASK_BYTES = 1024 * 1024 # Upper bound of turn markup sent to a worker per task
+PARALLEL_TASKS_PER_WORKER = 4 # Smaller tasks for small files, so every worker gets some
+PARALLEL_WINDOW_PER_WORKER = 2 # Tasks in flight per worker; bounds the memory held in the queue
+
+def render_turn_batch(task):
+    """Process-pool worker: renders a run of consecutive turns.
+
+    Returns the messages (None for turns without one), the status messages collected
+    while rendering, and the worker's metrics.
+    """
+    parser, encoding, language, first_index, slices = task
+    session = Session(language, log=[])
+    with use_session(session):
+        backend = PARSER_BACKENDS[parser]
+        messages = [render_turn_slice(raw, encoding, backend, first_index + offset)
+                    for offset, raw in enumerate(slices)]
+    return messages, session.log, session.metrics.as_dict()
 
+def iter_turn_batches(data, spans, encoding, parser, jobs):
+    """Groups the turn spans into tasks of about PARALLEL_TASK_BYTES, copying their bytes lazily."""
+    language = current_session().language
+    target = min(PARALLEL_TASK_BYTES, (spans[-1][1] - spans[0][0]) // (jobs * PARALLEL_TASKS_PER_WORKER))
+    first_index = 0
+    slices = []
+    size = 0
+    for index, (start, end) in enumerate(spans):
+        slices.append(data[start:end])
+        size += end - start
+        if size >= target:
+            yield start, (parser, encoding, language, first_index, slices)
+            first_index = index + 1
+            slices = []
+            size = 0
+    if slices:
+        yield spans[-1][0], (parser, encoding, language, first_index, slices)
+
+def iter_parallel_messages(data, parser, jobs, executor=None, encoding=None):
+    """Parallel counterpart of `iter_mapped_messages`, rendering turns on `jobs` worker processes.
+
+    `executor` may be an existing process pool to reuse; otherwise one is started and
+    shut down again. Encodings the byte scan cannot read, and exports without turns,
+    are extracted serially.
+    """
+    metrics = current_metrics()
+    backend = PARSER_BACKENDS[parser]
+    encoding, offset = (encoding, 0) if encoding else sniff_encoding(data)
+    spans = []
+    if is_ascii_compatible(encoding):
+        with metrics.stage("scan"):
+            spans = list(iter_turn_offsets(data, offset))
+    if not spans:
+        return (yield from iter_mapped_messages(data, backend, encoding))
+    metrics.count("bytes_in", len(data))
+    metrics.count("turns_found", len(spans))
+
+    own_executor = executor is None
+    if own_executor:
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(max_workers=jobs)
+    batches = iter_turn_batches(data, spans, encoding, parser, jobs)
+    pending = collections.deque()
+    released = 0
     try:
-        with open(json_file_path, 'w', encoding='utf-8') as f:
-            json.dump(chat_history, f, ensure_ascii=False, indent=2)
-        print(TEXTS["history_extracted_success"].format(path=json_file_path))
+        for _ in range(jobs * PARALLEL_WINDOW_PER_WORKER):
+            batch = next(batches, None)
+            if batch is None:
+                break
+            pending.append((batch[0], executor.submit(render_turn_batch, batch[1])))
+        while pending:
+            position, future = pending.popleft()
+            with metrics.stage("wait"):
+                messages, log, worker_metrics = future.result()
+            batch = next(batches, None)
+            if batch is not None:
+                pending.append((batch[0], executor.submit(render_turn_batch, batch[1])))
+            released = release_mapped_pages(data, released, position)
+            replay_reports(log)
+            metrics.merge(worker_metrics, prefix="worker_")
+            for message in messages:
+                if message is not None:
+                    yield message
+    finally:
+        for _, future in pending:
+            future.cancel()
+        if own_executor:
+            executor.shutdown()
+    return True
+
+def iter_parallel_source(source, parser, jobs, executor=None):
+    with map_source(source) as (data, encoding):
+        return (yield from iter_parallel_messages(data, parser, jobs, executor, encoding))
+
+def parallel_chat_history_to_json(html_file_path, json_file_path, parser=DEFAULT_PARSER, output_format=DEFAULT_FORMAT,
+                                  writer=None, jobs=None, executor=None):
+    """Extracts one file with its turns rendered on a process pool (see `iter_parallel_messages`)."""
+    return write_extraction(html_file_path, json_file_path, parser, output_format, writer,
+                            lambda backend: iter_parallel_source(html_file_path, parser, jobs or os.cpu_count() or 1,
+                                                                 executor))
+# --- End Parallel Rendering ---
+
+# --- Data Export Ingestion ---
+# The account data export is a zip with `conversations.json` (a JSON array of every
+# conversation) next to `chat.html`. Conversations are decoded one at a time straight
+# from the archive, so memory is bounded by the largest conversation.
+EXPORT_JSON_NAME = "conversations.json"
+EXPORT_EXTENSIONS = (".zip", ".json")
+EXPORT_TEXT_CONTENT_TYPES = ("text", "multimodal_text")
+JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+JSON_DELIMITERS = " \t\n\r,]"
+
+def is_data_export(path):
+    return path.lower().endswith(EXPORT_EXTENSIONS) and os.path.isfile(path)
+
+def default_export_output(export_path):
+    """Directory for the per-conversation files: `export.zip` -> `export/`."""
+    return os.path.splitext(export_path)[0]
+
+def iter_json_array(stream, chunk_size=STREAM_CHUNK_SIZE):
+    """Yields the elements of the top-level JSON array in a text stream, one at a time.
+
+    Only the element being decoded is buffered. When an element is incomplete, at least
+    as much again is read before decoding it once more, so even very large elements are
+    decoded in linear time. Raises ValueError for malformed or truncated input.
+    """
+    metrics = current_metrics()
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    eof = False
+    state = "start" # -> "first" after '[', "separator" after a value, "value" after ','
+    while True:
+        position = JSON_WHITESPACE.match(buffer, position).end()
+        if position == len(buffer):
+            if eof:
+                raise ValueError("unexpected end of JSON data")
+            with metrics.stage("read"):
+                buffer, position = stream.read(chunk_size), 0
+            eof = not buffer
+            continue
+        char = buffer[position]
+        if state == "start":
+            if char != '[':
+                raise ValueError(f"expected a JSON array, found {char!r}")
+            state = "first"
+            position += 1
+            continue
+        if char == ']' and state in ("first", "separator"):
+            return
+        if state == "separator":
+            if char != ',':
+                raise ValueError(f"expected ',' or ']' in the JSON array, found {char!r}")
+            state = "value"
+            position += 1
+            continue
+        try:
+            with metrics.stage("decode"):
+                value, end = decoder.raw_decode(buffer, position)
+            # Objects, arrays and strings end with their closing character; a number may go
+            # on in the next chunk, so it only counts once a delimiter follows it.
+            complete = (isinstance(value, (dict, list, str)) or eof
+                        or (end < len(buffer) and buffer[end] in JSON_DELIMITERS))
+        except json.JSONDecodeError:
+            complete = False
+        if not complete: # Read more and decode the element again
+            if eof:
+                raise ValueError("malformed element in the JSON array")
+            with metrics.stage("read"):
+                chunk = stream.read(max(chunk_size, len(buffer) - position))
+            buffer, position = buffer[position:] + chunk, 0
+            eof = not chunk
+            continue
+        yield value
+        state = "separator"
+        position = end
+        if position > chunk_size: # Drop the elements already decoded
+            buffer, position = buffer[position:], 0
+
+def is_zip_source(source):
+    import zipfile
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source[:4]) == b"PK\x03\x04"
+    if hasattr(source, 'read'):
+        if isinstance(source, io.TextIOBase) or not source.seekable():
+            return False
+        start = source.tell()
+        try:
+            return zipfile.is_zipfile(source)
+        finally:
+            source.seek(start)
+    return zipfile.is_zipfile(source)
+
+@contextlib.contextmanager
+def open_data_export(source):
+    """Opens `conversations.json` of a data export as text.
+
+    `source` is the export zip (read in place, without extracting it) or
+    `conversations.json` itself, as a path, bytes or a file object.
+    """
+    if not is_zip_source(source):
+        with ExportSource(source, encoding='utf-8').open() as f:
+            yield f
+        return
+    import zipfile
+    archive_source = io.BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else source
+    with zipfile.ZipFile(archive_source) as archive:
+        members = [name for name in archive.namelist() if os.path.basename(name) == EXPORT_JSON_NAME]
+        if not members:
+            raise FileNotFoundError(f"{EXPORT_JSON_NAME} not found in the archive")
+        with archive.open(min(members, key=len)) as member: # The top-level copy if there are several
+            with ExportSource(member, encoding='utf-8').open() as f:
+                yield f
+
+def active_branch(mapping, current_node):
+    """Returns the message nodes from the root to `current_node`, the branch the page shows.
+
+    Edited prompts and regenerated answers are sibling subtrees of `mapping`. Without a
+    valid `current_node`, the newest branch (the last child at every level) is used.
+    """
+    if current_node not in mapping:
+        roots = [node_id for node_id, node in mapping.items() if node.get("parent") not in mapping]
+        current_node = roots[0] if roots else None
+        while current_node is not None:
+            children = [child for child in mapping[current_node].get("children") or () if child in mapping]
+            if not children:
+                break
+            current_node = children[-1]
+    branch = []
+    seen = set()
+    node_id = current_node
+    while node_id in mapping and node_id not in seen: # `seen` guards against cycles in damaged exports
+        seen.add(node_id)
+        branch.append(mapping[node_id])
+        node_id = mapping[node_id].get("parent")
+    branch.reverse()
+    return branch
+
+def export_message(message):
+    """Formats a `mapping` node's message as a {"speaker", "text"} record, or returns None.
+
+    Only roles with a message rule (user and assistant) are kept, like on the page;
+    system prompts, tool calls and results, hidden and empty messages are skipped.
+    """
+    if not message:
+        return None
+    role = (message.get("author") or {}).get("role")
+    if role not in MESSAGE_RULES or message.get("recipient", "all") != "all":
+        return None
+    if (message.get("metadata") or {}).get("is_visually_hidden_from_conversation"):
+        return None
+    content = message.get("content") or {}
+    if content.get("content_type") not in EXPORT_TEXT_CONTENT_TYPES:
+        return None
+    text = "\n".join(part for part in content.get("parts") or () if isinstance(part, str)).strip()
+    if not text:
+        return None
+    return {
+        "speaker": role,
+        "text": text
+    }
+
+def iter_export_conversations(source, chunk_size=STREAM_CHUNK_SIZE):
+    """Yields {"id", "title", "create_time", "messages"} for every conversation of a data export."""
+    metrics = current_metrics()
+    with open_data_export(source) as f:
+        for conversation in iter_json_array(f, chunk_size):
+            with metrics.stage("render"):
+                branch = active_branch(conversation.get("mapping") or {}, conversation.get("current_node"))
+                messages = [message for message in map(export_message, (node.get("message") for node in branch))
+                            if message is not None]
+            metrics.count("conversations_found")
+            yield {
+                "id": conversation.get("conversation_id") or conversation.get("id"),
+                "title": conversation.get("title") or "",
+                "create_time": conversation.get("create_time"),
+                "messages": messages,
+            }
+
+def conversation_filename(conversation, index, output_format, taken):
+    """`<title>-<id prefix>.json`, with the title reduced to a safe file name.
+
+    Names already in `taken` (compared case-insensitively, for case-insensitive file
+    systems) get a numeric suffix, so conversations sharing a title and id prefix never
+    overwrite each other. The returned name is added to `taken`.
+    """
+    title = re.sub(r'[^\w]+', '-', conversation["title"]).strip('-')[:60] or "conversation"
+    stem = f"{title}-{(conversation['id'] or str(index))[:8]}"
+    name = stem
+    number = 1
+    while name.lower() in taken:
+        number += 1
+        name = f"{stem}-{number}"
+    taken.add(name.lower())
+    return name + OUTPUT_FORMATS[output_format]
+
+def export_conversations(source, output_path, output_format=DEFAULT_FORMAT, chunk_size=STREAM_CHUNK_SIZE):
+    """Writes every conversation of a data export, as files or as one JSON Lines stream.
+
+    If `output_path` ends with `.jsonl`, all messages go into that file, one per line,
+    tagged with their conversation's id and title. Otherwise `output_path` is a directory
+    that receives one `output_format` file per conversation. Returns the number of
+    messages written, or None if nothing was written.
+    """
+    metrics = current_metrics()
+    combined = output_path.lower().endswith(OUTPUT_FORMATS["jsonl"])
+    if combined:
+        stream_writer = JSONLinesWriter(output_path)
+    else:
+        os.makedirs(output_path, exist_ok=True)
+        taken = set()
+    conversations = 0
+    empty = 0
+    total = 0
+    try:
+        for index, conversation in enumerate(iter_export_conversations(source, chunk_size)):
+            conversations += 1
+            if not conversation["messages"]:
+                empty += 1
+                continue
+            if combined:
+                writer = stream_writer
+                records = ({"conversation_id": conversation["id"], "title": conversation["title"], **message}
+                           for message in conversation["messages"])
+            else:
+                writer = MESSAGE_WRITERS[output_format](
+                    os.path.join(output_path, conversation_filename(conversation, index, output_format, taken)))
+                records = conversation["messages"]
+            with metrics.stage("serialize"):
+                for record in records:
+                    writer.write(record)
+                if not combined:
+                    writer.close()
+                    metrics.count("bytes_out", writer.bytes_written)
+            if writer.error is not None:
+                report("error_writing_json", error=writer.error)
+                return
+            total += len(conversation["messages"])
+    except Exception as e: # Missing or corrupt archive, malformed JSON
+        report("error_reading_export", path=source, error=e)
+        if combined:
+            stream_writer.close(discard=True)
+        return
+    if combined:
+        with metrics.stage("serialize"):
+            stream_writer.close()
+        metrics.count("bytes_out", stream_writer.bytes_written)
+        if stream_writer.error is not None:
+            report("error_writing_json", error=stream_writer.error)
+            return
+    if not total:
+        report("no_history_extracted")
+        return
+    report("export_conversations_written", conversations=conversations - empty, messages=total, empty=empty,
+           path=output_path)
+    return total
+# --- End Data Export Ingestion ---
+
+# --- Incremental Cache ---
+CACHE_VERSION = 2 # Bump whenever the formatting of messages changes, so stale entries are never reused
+DEFAULT_CACHE_SIZE_MB = 512
+CACHE_DB_NAME = "extraction-cache.sqlite3"
+
+class ExtractionCache:
+    """On-disk LRU cache of rendered messages, keyed by content hash.
+
+    Two kinds of entries share one SQLite table: whole files (content hash -> output
+    path and message count) and single turns (hash of the turn's raw bytes -> message).
+    Entries are evicted least-recently-used first once the total size exceeds `max_bytes`.
+    `stats` counts hits and misses for the lifetime of this object.
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_CACHE_SIZE_MB * 1024 * 1024):
+        import sqlite3
+        os.makedirs(cache_dir, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.db = sqlite3.connect(os.path.join(cache_dir, CACHE_DB_NAME), timeout=60)
+        self.db.execute("PRAGMA journal_mode=WAL") # Batch workers share the cache
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self.db.commit()
+        self.touched = []
+        self.stats = {"file_hits": 0, "file_misses": 0, "turn_hits": 0, "turn_misses": 0, "evictions": 0}
+
+    @staticmethod
+    def file_key(content_hash, parser, output_format, output_path):
+        # One entry per output, so the same input written to two places (or two identical inputs) do not evict each other
+        return f"file:{CACHE_VERSION}:{parser}:{output_format}:{content_hash}:{os.path.abspath(output_path)}"
+
+    @staticmethod
+    def turn_key(raw, parser, encoding):
+        # Rendered turns are only reused with the parser backend and the encoding that produced them
+        return f"turn:{CACHE_VERSION}:{parser}:{encoding}:" + hashlib.sha256(raw).hexdigest()
+
+    def get(self, key):
+        row = self.db.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self.touched.append(key)
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        encoded = json.dumps(value, ensure_ascii=False)
+        self.db.execute(
+            "INSERT OR REPLACE INTO entries (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+            (key, encoded, len(key) + len(encoded.encode('utf-8')), time.time())
+        )
+
+    def commit(self):
+        """Records LRU timestamps for this run's hits, evicts over the size cap and commits."""
+        now = time.time()
+        self.db.executemany("UPDATE entries SET last_used = ? WHERE key = ?", [(now, key) for key in self.touched])
+        self.touched = []
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total > self.max_bytes:
+            for key, size in self.db.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall():
+                if total <= self.max_bytes:
+                    break
+                self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total -= size
+                self.stats["evictions"] += 1
+        self.db.commit()
+
+    def close(self):
+        self.commit()
+        self.db.close()
+
+def hash_file(path, chunk_size=STREAM_CHUNK_SIZE):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def cached_chat_history_to_json(html_file_path, json_file_path, cache, chunk_size=STREAM_CHUNK_SIZE, parser=DEFAULT_PARSER,
+                                output_format=DEFAULT_FORMAT, writer=None):
+    """Incremental extraction: skips unchanged files and re-renders only turns not seen before.
+
+    Turns are located with the byte scan of `iter_mapped_messages`, so the turns of an
+    export that only grew since the last run are looked up by their bytes and never parsed.
+    Returns the number of messages in the output, or None if nothing was written.
+    """
+    if not os.path.exists(html_file_path):
+        report("error_html_not_found", path=html_file_path)
+        return
+    metrics = current_metrics()
+    try:
+        with metrics.stage("hash"):
+            content_hash = hash_file(html_file_path, chunk_size)
     except Exception as e:
-        print(TEXTS["error_writing_json"].format(error=e))
+        report("error_reading_html", error=e)
+        return
 
-if __name__ == '__main__':
+    file_key = ExtractionCache.file_key(content_hash, parser, output_format, json_file_path)
+    with metrics.stage("cache"):
+        entry = cache.get(file_key)
+    if entry and entry["output"] == os.path.abspath(json_file_path) and os.path.exists(json_file_path):
+        cache.stats["file_hits"] += 1
+        report("cache_file_unchanged", path=html_file_path)
+        cache.commit()
+        return entry["messages"]
+    cache.stats["file_misses"] += 1
+
+    count = mapped_chat_history_to_json(html_file_path, json_file_path, parser, output_format, writer, cache)
+    with metrics.stage("cache"):
+        if count:
+            cache.put(file_key, {"output": os.path.abspath(json_file_path), "messages": count})
+        cache.commit()
+    return count
+# --- End Incremental Cache ---
+
+# --- Batch Processing ---
+HTML_EXTENSIONS = (".html", ".htm")
+MANIFEST_NAME = "manifest.json"
+
+def is_glob_pattern(path):
+    return any(char in path for char in "*?[")
+
+def expand_inputs(inputs, extensions=HTML_EXTENSIONS):
+    """Resolves files, directories and glob patterns to (html_path, output_relative_path) pairs.
+
+    Directories are searched recursively for files with one of `extensions`.
+    """
+    found = {}
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith(extensions):
+                        path = os.path.join(root, name)
+                        found.setdefault(path, os.path.relpath(path, item))
+        elif is_glob_pattern(item) and not os.path.exists(item):
+            for path in sorted(glob.glob(item, recursive=True)):
+                if os.path.isfile(path):
+                    found.setdefault(path, os.path.basename(path))
+        else:
+            found.setdefault(item, os.path.basename(item))
+    return list(found.items())
+
+def is_batch_request(inputs):
+    return len(inputs) > 1 or any(os.path.isdir(item) or (is_glob_pattern(item) and not os.path.exists(item)) for item in inputs)
+
+def process_file(job):
+    """Runs one extraction with status messages collected into a manifest entry (process-pool worker)."""
+    session = Session(job["language"], log=[])
+    started = time.perf_counter()
+    count = None
+    cache = None
+    profile_path = job["output"] + ".prof" if job["profile"] else None
+    with use_session(session):
+        try:
+            output_dir = os.path.dirname(job["output"])
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+            with capture_profile(profile_path, job["trace_memory"]):
+                if job["cache_dir"]:
+                    cache = ExtractionCache(job["cache_dir"], job["cache_size"])
+                    count = cached_chat_history_to_json(job["input"], job["output"], cache, job["chunk_size"],
+                                                        job["parser"], job["format"])
+                elif job["mmap"]:
+                    count = mapped_chat_history_to_json(job["input"], job["output"], job["parser"], job["format"])
+                elif job["stream"]:
+                    count = stream_chat_history_to_json(job["input"], job["output"], job["chunk_size"], job["parser"],
+                                                        output_format=job["format"])
+                else:
+                    count = extract_chat_history_to_json(job["input"], job["output"], job["parser"], job["format"])
+        except Exception as e:
+            report("error_unexpected", path=job["input"], error=e)
+        finally:
+            if cache is not None:
+                cache.close()
+    entry = manifest_entry(job, count, session.log, time.perf_counter() - started)
+    if cache is not None:
+        entry["cache"] = cache.stats
+    entry["metrics"] = session.metrics.as_dict()
+    return entry
+
+def manifest_entry(job, count, log, seconds):
+    if count:
+        status = "ok"
+    elif any(item["kind"].startswith("error_") for item in log):
+        status = "failed"
+    else:
+        status = "empty"
+    return {
+        "input": job["input"],
+        "output": job["output"] if count else None,
+        "status": status,
+        "messages": count or 0,
+        "bytes": job["bytes"],
+        "seconds": round(seconds, 3),
+        "log": log,
+    }
+
+def batch_job(html_path, output_path, **options):
+    """A process_file job: the input and output paths plus the extraction options."""
+    return {
+        "input": html_path,
+        "output": output_path,
+        "bytes": os.path.getsize(html_path) if os.path.isfile(html_path) else 0,
+        "language": current_session().language,
+        **options,
+    }
+
+def claim_outputs(batch_jobs):
+    """Splits off jobs whose output path was already taken by an earlier input.
+
+    With -o, dir1/chat.html and dir2/chat.html (or chat.html and chat.htm) map to the same
+    output file; the first input keeps it and the others fail instead of overwriting it.
+    Returns (jobs to run, manifest entries of the rejected ones).
+    """
+    owners = {}
+    accepted = []
+    rejected = []
+    for job in batch_jobs:
+        key = os.path.normcase(os.path.abspath(job["output"]))
+        if key in owners:
+            text = current_session().texts["error_duplicate_output"].format(path=job["input"], output=job["output"],
+                                                                            other=owners[key])
+            rejected.append(manifest_entry(job, None, [{"kind": "error_duplicate_output", "text": text}], 0))
+        else:
+            owners[key] = job["input"]
+            accepted.append(job)
+    return accepted, rejected
+
+def run_batch(inputs, output_dir=None, jobs=None, parser=DEFAULT_PARSER, stream=False,
+              chunk_size=STREAM_CHUNK_SIZE, manifest_path=None, cache_dir=None,
+              cache_size=DEFAULT_CACHE_SIZE_MB * 1024 * 1024, output_format=DEFAULT_FORMAT,
+              metrics_path=None, profile=False, trace_memory=False, mmap=False):
+    """Extracts every HTML file matched by `inputs` on a process pool and writes a JSON manifest.
+
+    Returns the manifest dict, or None if no input files matched.
+    """
+    batch_jobs = []
+    for html_path, relative_path in expand_inputs(inputs):
+        target = os.path.join(output_dir, relative_path) if output_dir else html_path
+        batch_jobs.append(batch_job(html_path, default_output_path(target, output_format), parser=parser, stream=stream,
+                                    mmap=mmap, chunk_size=chunk_size, cache_dir=cache_dir, cache_size=cache_size,
+                                    format=output_format, profile=profile, trace_memory=trace_memory))
+    if not batch_jobs:
+        report("no_input_files")
+        return None
+    batch_jobs, results = claim_outputs(batch_jobs)
+
+    # Largest files first, so a single giant export does not end up running alone at the tail
+    batch_jobs.sort(key=lambda job: job["bytes"], reverse=True)
+    workers = min(jobs or os.cpu_count() or 1, len(batch_jobs))
+    started = time.perf_counter()
+    if workers == 1:
+        results += [process_file(job) for job in batch_jobs]
+    else:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(process_file, job): job for job in batch_jobs}
+            for future in as_completed(futures):
+                job = futures[future]
+                try:
+                    results.append(future.result())
+                except Exception as e: # e.g. a worker killed by the OOM killer
+                    text = current_session().texts["error_unexpected"].format(path=job["input"], error=e)
+                    results.append(manifest_entry(job, None, [{"kind": "error_unexpected", "text": text}], 0))
+    results.sort(key=lambda entry: entry["input"])
+    if metrics_path:
+        mode = "mapped" if mmap or cache_dir else "stream" if stream else "tree"
+        for entry in results:
+            emit_metrics(metrics_record(entry["input"], entry["output"], parser, mode, output_format, entry["messages"],
+                                        entry["seconds"], entry.get("metrics", {})), metrics_path)
+        if metrics_path != "-":
+            report("metrics_written", path=metrics_path)
+
+    summary = {
+        "files": len(results),
+        "ok": sum(entry["status"] == "ok" for entry in results),
+        "empty": sum(entry["status"] == "empty" for entry in results),
+        "failed": sum(entry["status"] == "failed" for entry in results),
+        "messages": sum(entry["messages"] for entry in results),
+        "bytes": sum(entry["bytes"] for entry in results),
+        "jobs": workers,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    if cache_dir:
+        summary["cache"] = {key: sum(entry.get("cache", {}).get(key, 0) for entry in results)
+                            for key in ("file_hits", "file_misses", "turn_hits", "turn_misses", "evictions")}
+    manifest = {"summary": summary, "files": results}
+
+    if manifest_path is None:
+        manifest_path = os.path.join(output_dir or ".", MANIFEST_NAME)
+    report("batch_summary", **{key: summary[key] for key in ("files", "ok", "empty", "failed", "messages", "seconds")})
+    if cache_dir:
+        report("cache_stats", **summary["cache"])
+    try:
+        manifest_dir = os.path.dirname(manifest_path)
+        if manifest_dir:
+            os.makedirs(manifest_dir, exist_ok=True)
+        write_json_atomically(manifest_path, manifest)
+        report("batch_manifest_written", path=manifest_path)
+    except Exception as e:
+        report("error_writing_json", error=e)
+    return manifest
+# --- End Batch Processing ---
+
+# --- Search Index ---
+# Extracted conversations are loaded into SQLite: `files` remembers every indexed source
+# (content hash, size, mtime) so unchanged files are skipped on re-index, `messages` holds
+# the records, and the FTS5 table `messages_fts` indexes their text (external content,
+# kept in sync by triggers, so the text is stored only once).
+INDEX_DB_NAME = "chat-index.sqlite3"
+INDEX_EXTENSIONS = (".json", ".jsonl") + HTML_EXTENSIONS
+INDEX_COMMIT_MESSAGES = 50000 # Messages inserted per transaction
+DEFAULT_SEARCH_LIMIT = 20
+SNIPPET_TOKENS = 16
+INDEX_SCHEMA_VERSION = 2 # Databases with another PRAGMA user_version are rebuilt
+INDEX_DROP = """
+DROP TABLE IF EXISTS messages_fts;
+DROP TABLE IF EXISTS messages;
+DROP TABLE IF EXISTS files;
+"""
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    content_hash TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    messages INTEGER NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL REFERENCES files (id),
+    position INTEGER NOT NULL, -- Index of the message in its file (extracted files do not record turn numbers)
+    speaker TEXT NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_file ON messages (file_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (
+    text, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS messages_after_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_after_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+SEARCH_SQL = """
+SELECT files.path, messages.position, messages.speaker, files.content_hash,
+       snippet(messages_fts, 0, '[', ']', '...', ?), bm25(messages_fts)
+FROM messages_fts
+JOIN messages ON messages.id = messages_fts.rowid
+JOIN files ON files.id = messages.file_id
+WHERE messages_fts MATCH ? {speaker_filter}
+ORDER BY bm25(messages_fts)
+LIMIT ?
+"""
+
+def read_message_file(path, parser=DEFAULT_PARSER):
+    """Returns the {"speaker", "text"} messages of an extracted .json/.jsonl file or of an HTML export."""
+    if path.lower().endswith(HTML_EXTENSIONS):
+        return extract(path, parser=parser, mapped=True)
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.lower().endswith(OUTPUT_FORMATS["jsonl"]):
+            messages = [json.loads(line) for line in f if line.strip()]
+        else:
+            messages = json.load(f)
+    if not isinstance(messages, list) or not all(
+            isinstance(message, dict) and "speaker" in message and "text" in message for message in messages):
+        raise ValueError("not a list of extracted messages")
+    return messages
+
+class SearchIndex:
+    """SQLite FTS5 index of extracted messages (speaker, text, position in the file, source file, content hash)."""
+
+    def __init__(self, db_path):
+        import sqlite3
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.db = sqlite3.connect(db_path, timeout=60)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL") # Still crash-safe with WAL; much faster bulk inserts
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != INDEX_SCHEMA_VERSION:
+            self.db.executescript(INDEX_DROP) # Empty, or an older layout: the next `index` run fills it again
+            self.db.execute(f"PRAGMA user_version = {INDEX_SCHEMA_VERSION}")
+        self.db.executescript(INDEX_SCHEMA)
+        self.pending = 0
+
+    def is_unchanged(self, path, stat):
+        """Returns (unchanged, content_hash) for `path` against its last indexed version.
+
+        A matching size and mtime counts as unchanged without reading the file; otherwise
+        the content hash decides (and the stored stat is refreshed if only it changed).
+        """
+        row = self.db.execute("SELECT content_hash, size, mtime_ns FROM files WHERE path = ?", (path,)).fetchone()
+        if row is not None and (row[1], row[2]) == (stat.st_size, stat.st_mtime_ns):
+            return True, row[0]
+        content_hash = hash_file(path)
+        if row is not None and row[0] == content_hash:
+            self.db.execute("UPDATE files SET size = ?, mtime_ns = ? WHERE path = ?",
+                            (stat.st_size, stat.st_mtime_ns, path))
+            return True, content_hash
+        return False, content_hash
+
+    def add_file(self, path, content_hash, stat, messages):
+        """Replaces the messages of `path`; commits once INDEX_COMMIT_MESSAGES have accumulated."""
+        self.remove_file(path)
+        cursor = self.db.execute(
+            "INSERT INTO files (path, content_hash, size, mtime_ns, messages, indexed_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (path, content_hash, stat.st_size, stat.st_mtime_ns, len(messages), time.time())
+        )
+        file_id = cursor.lastrowid
+        self.db.executemany(
+            "INSERT INTO messages (file_id, position, speaker, text) VALUES (?, ?, ?, ?)",
+            ((file_id, position, message["speaker"], message["text"]) for position, message in enumerate(messages))
+        )
+        self.pending += len(messages)
+        if self.pending >= INDEX_COMMIT_MESSAGES:
+            self.commit()
+
+    def remove_file(self, path):
+        """Removes `path` and its messages. Returns whether it was indexed."""
+        row = self.db.execute("SELECT id FROM files WHERE path = ?", (path,)).fetchone()
+        if row is not None:
+            self.db.execute("DELETE FROM messages WHERE file_id = ?", row)
+            self.db.execute("DELETE FROM files WHERE id = ?", row)
+        return row is not None
+
+    def prune(self):
+        """Removes files that no longer exist. Returns how many were removed."""
+        missing = [path for (path,) in self.db.execute("SELECT path FROM files") if not os.path.exists(path)]
+        for path in missing:
+            self.remove_file(path)
+        return len(missing)
+
+    def search(self, query, limit=DEFAULT_SEARCH_LIMIT, speaker=None):
+        """Returns the best matches for an FTS5 `query` as dicts, most relevant first.
+
+        Queries that are not valid FTS5 syntax are searched again as plain words.
+        """
+        import sqlite3
+        sql = SEARCH_SQL.format(speaker_filter="AND messages.speaker = ?" if speaker else "")
+        try:
+            rows = self.db.execute(sql, self.search_parameters(query, limit, speaker)).fetchall()
+        except sqlite3.OperationalError: # e.g. unbalanced quotes or a bare operator
+            words = " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+            rows = self.db.execute(sql, self.search_parameters(words, limit, speaker)).fetchall() if words else []
+        return [{"path": path, "position": position, "speaker": message_speaker, "content_hash": content_hash,
+                 "snippet": snippet, "score": -score}
+                for path, position, message_speaker, content_hash, snippet, score in rows]
+
+    @staticmethod
+    def search_parameters(query, limit, speaker):
+        return (SNIPPET_TOKENS, query) + ((speaker,) if speaker else ()) + (limit,)
+
+    def commit(self):
+        self.db.commit()
+        self.pending = 0
+
+    def close(self):
+        self.commit()
+        self.db.close()
+
+def is_own_artifact(path, db_path):
+    """Files this tool writes besides conversations: manifests, watch stats, databases and temporary files."""
+    name = os.path.basename(path)
+    return (name.startswith(".") or name in (MANIFEST_NAME, WATCH_STATS_NAME, CACHE_DB_NAME, INDEX_DB_NAME)
+            or os.path.abspath(path) == os.path.abspath(db_path))
+
+def select_index_files(paths):
+    """Splits `paths` into (files to index, files left out) so that no conversation is indexed twice.
+
+    An HTML export and its own extracted output (the same name with .json or .jsonl)
+    hold the same messages. The output is indexed if it is at least as new as the export
+    (the rule watch mode uses to decide whether a file needs converting), the export
+    otherwise.
+    """
+    groups = collections.defaultdict(list)
+    for path in paths:
+        groups[os.path.normcase(os.path.abspath(os.path.splitext(path)[0]))].append(path)
+    left_out = set()
+    for group in groups.values():
+        exports = [path for path in group if path.lower().endswith(HTML_EXTENSIONS)]
+        outputs = [path for path in group if path not in exports]
+        if not exports or not outputs:
+            continue
+        export_mtime = max(modification_time(path) for path in exports)
+        current = [path for path in outputs if modification_time(path) >= export_mtime]
+        keep = current[:1] or exports
+        left_out.update(path for path in group if path not in keep)
+    return [path for path in paths if path not in left_out], [path for path in paths if path in left_out]
+
+def modification_time(path):
+    signature = file_signature(path)
+    return signature[1] if signature is not None else -1
+
+def index_files(inputs, db_path=INDEX_DB_NAME, parser=DEFAULT_PARSER, prune=False):
+    """Indexes extracted .json/.jsonl files (and HTML exports) matched by `inputs`. Returns the summary dict.
+
+    The tool's own files are skipped, and of an HTML export and its extracted output only
+    one is indexed (see `select_index_files`); the other is removed from the index.
+    """
+    started = time.perf_counter()
+    summary = {"indexed": 0, "unchanged": 0, "failed": 0, "removed": 0, "messages": 0}
+    index = SearchIndex(db_path)
+    try:
+        paths = [path for path, _ in expand_inputs(inputs, INDEX_EXTENSIONS) if not is_own_artifact(path, db_path)]
+        paths, duplicates = select_index_files(paths)
+        for path in duplicates:
+            summary["removed"] += index.remove_file(os.path.abspath(path))
+        for path in paths:
+            path = os.path.abspath(path)
+            try:
+                stat = os.stat(path)
+                unchanged, content_hash = index.is_unchanged(path, stat)
+                if unchanged:
+                    summary["unchanged"] += 1
+                    continue
+                messages = read_message_file(path, parser)
+            except Exception as e:
+                report("index_file_failed", path=path, error=e)
+                summary["failed"] += 1
+                continue
+            index.add_file(path, content_hash, stat, messages)
+            summary["indexed"] += 1
+            summary["messages"] += len(messages)
+        if prune:
+            summary["removed"] = index.prune()
+    finally:
+        index.close()
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+    report("index_summary", **summary)
+    return summary
+# --- End Search Index ---
+
+# --- Watch Mode ---
+WATCH_STATS_NAME = "watch-stats.json"
+WATCH_DEBOUNCE_SECONDS = 2.0 # A file must keep the same size and mtime this long before it is converted
+WATCH_POLL_INTERVAL = 2.0
+WATCH_QUEUE_SIZE = 64
+WATCH_STATS_INTERVAL = 5.0
+WATCH_LATENCY_SAMPLES = 1024 # Percentiles are computed over the most recent files
+WATCH_RECENT_SECONDS = 60.0
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+def is_watched_name(name):
+    """HTML files, except hidden ones (temporary files of sync tools and of our own writers)."""
+    return not name.startswith(".") and name.lower().endswith(HTML_EXTENSIONS)
+
+def file_signature(path):
+    """(size, mtime) of `path`, or None if it does not exist (any more)."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+def scan_watch_directory(directory):
+    """Maps every watched file directly inside `directory` to its signature."""
+    snapshot = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if is_watched_name(entry.name) and entry.is_file():
+                stat = entry.stat()
+                snapshot[entry.path] = (stat.st_size, stat.st_mtime_ns)
+    return snapshot
+
+class InotifyWatcher:
+    """Reports files written or moved into a directory, using Linux inotify through ctypes."""
+    name = "inotify"
+    interval = None # Event driven: wait until something happens
+
+    def __init__(self, directory):
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        self.directory = directory
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {directory}")
+
+    def changes(self, timeout):
+        """Waits up to `timeout` seconds. Returns (changed paths, overflow); after an overflow events were lost."""
+        import select
+        import struct
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return set(), False
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set(), False
+        paths = set()
+        overflow = False
+        offset = 0
+        while offset + 16 <= len(data): # struct inotify_event: wd, mask, cookie, len, then the name
+            _, mask, _, length = struct.unpack_from("iIII", data, offset)
+            name = data[offset + 16:offset + 16 + length].rstrip(b"\0")
+            offset += 16 + length
+            if mask & IN_Q_OVERFLOW:
+                overflow = True
+            elif name:
+                paths.add(os.path.join(self.directory, os.fsdecode(name)))
+        return paths, overflow
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher:
+    """Fallback for other platforms and network file systems: re-lists the directory every `interval` seconds."""
+    name = "polling"
+
+    def __init__(self, directory, interval=WATCH_POLL_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self.snapshot = scan_watch_directory(directory)
+        self.next_scan = time.monotonic() + interval
+
+    def changes(self, timeout):
+        time.sleep(timeout)
+        now = time.monotonic()
+        if now < self.next_scan:
+            return set(), False
+        self.next_scan = now + self.interval
+        current = scan_watch_directory(self.directory)
+        changed = {path for path, signature in current.items() if self.snapshot.get(path) != signature}
+        self.snapshot = current
+        return changed, False
+
+    def close(self):
+        pass
+
+def open_watcher(directory, poll_interval=WATCH_POLL_INTERVAL, polling=False):
+    """inotify where available, polling otherwise (or when `polling` is set)."""
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError): # e.g. out of inotify instances, or a libc without inotify
+            pass
+    return PollingWatcher(directory, poll_interval)
+
+def latency_summary(values):
+    """Nearest-rank percentiles of `values` in seconds."""
+    ordered = sorted(values)
+    if not ordered:
+        return {"samples": 0}
+    def percentile(fraction):
+        return round(ordered[max(0, math.ceil(fraction * len(ordered)) - 1)], 4)
+    return {"samples": len(ordered), "p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99),
+            "max": round(ordered[-1], 4)}
+
+class WatchStats:
+    """Queue depth, latency percentiles and throughput of a watch run, shared by the worker threads.
+
+    Latency is measured from the moment a file has settled (passed the debounce) until its
+    output is in place, so it includes the time spent waiting in the queue.
+    """
+
+    def __init__(self, directory, watcher_name, work, jobs):
+        self.lock = threading.Lock()
+        self.directory = directory
+        self.watcher_name = watcher_name
+        self.work = work
+        self.jobs = jobs
+        self.started_at = time.time()
+        self.started = time.monotonic()
+        self.in_flight = 0
+        self.statuses = collections.Counter()
+        self.messages = 0
+        self.bytes = 0
+        self.latencies = collections.deque(maxlen=WATCH_LATENCY_SAMPLES)
+        self.durations = collections.deque(maxlen=WATCH_LATENCY_SAMPLES)
+        self.recent = collections.deque() # Completion times within the last WATCH_RECENT_SECONDS
+        self.backpressure_waits = 0
+        self.backpressure_seconds = 0.0
+
+    def job_started(self):
+        with self.lock:
+            self.in_flight += 1
+
+    def job_finished(self, entry, latency):
+        with self.lock:
+            self.in_flight -= 1
+            self.statuses[entry["status"]] += 1
+            self.messages += entry["messages"]
+            self.bytes += entry["bytes"]
+            self.latencies.append(latency)
+            self.durations.append(entry["seconds"])
+            self.recent.append(time.monotonic())
+
+    def backpressure(self, seconds):
+        with self.lock:
+            self.backpressure_waits += 1
+            self.backpressure_seconds += seconds
+
+    def snapshot(self, pending=0):
+        with self.lock:
+            now = time.monotonic()
+            while self.recent and self.recent[0] < now - WATCH_RECENT_SECONDS:
+                self.recent.popleft()
+            uptime = max(now - self.started, 1e-9)
+            return {
+                "directory": self.directory,
+                "watcher": self.watcher_name,
+                "jobs": self.jobs,
+                "started_at": self.started_at,
+                "updated_at": time.time(),
+                "uptime_seconds": round(uptime, 3),
+                "queue": {
+                    "depth": self.work.qsize(),
+                    "capacity": self.work.maxsize,
+                    "in_flight": self.in_flight,
+                    "settling": pending,
+                    "backpressure_waits": self.backpressure_waits,
+                    "backpressure_seconds": round(self.backpressure_seconds, 3),
+                },
+                "files": {"processed": sum(self.statuses.values()), **{status: self.statuses[status]
+                                                                      for status in ("ok", "empty", "failed")}},
+                "messages": self.messages,
+                "latency_seconds": latency_summary(self.latencies),
+                "processing_seconds": latency_summary(self.durations),
+                "throughput": {
+                    "files_per_second": round(sum(self.statuses.values()) / uptime, 4),
+                    "mb_per_second": round(self.bytes / (1024 * 1024) / uptime, 4),
+                    "files_last_minute": len(self.recent),
+                },
+            }
+
+    def write(self, path, pending=0):
+        try:
+            write_json_atomically(path, self.snapshot(pending))
+        except OSError as e:
+            report("error_writing_json", error=e)
+
+def warm_worker(parser, pool_process=False):
+    """Imports the parser backend up front, so the first file does not pay for it."""
+    if pool_process: # Signals sent to the whole process group are handled by the watcher, which lets running files finish
+        import signal
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    with contextlib.suppress(ImportError): # Reported per file by the extraction itself
+        PARSER_BACKENDS[parser].require()
+
+@contextlib.contextmanager
+def interrupts_ignored():
+    """Ignores SIGINT and SIGTERM in the body, so that shutdown always completes.
+
+    After the first interrupt, another one can follow at once (`timeout` and service
+    managers signal the process and then its whole group). Only the main thread can
+    change signal handlers; elsewhere the body runs unchanged.
+    """
+    import signal
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+    previous = [(number, signal.signal(number, signal.SIG_IGN)) for number in (signal.SIGINT, signal.SIGTERM)]
+    try:
+        yield
+    finally:
+        for number, handler in previous:
+            signal.signal(number, handler if handler is not None else signal.SIG_DFL)
+
+def watch_worker(work, executor, stats, session, finished):
+    """Worker thread: runs queued jobs (in this process, or on the warm pool) until `finished` is set."""
+    with use_session(session):
+        while not finished.is_set():
+            try:
+                job, settled = work.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            stats.job_started()
+            try:
+                entry = executor.submit(process_file, job).result() if executor else process_file(job)
+            except Exception as e: # e.g. a worker killed by the OOM killer
+                text = current_session().texts["error_unexpected"].format(path=job["input"], error=e)
+                entry = manifest_entry(job, None, [{"kind": "error_unexpected", "text": text}], 0)
+            stats.job_finished(entry, time.monotonic() - settled)
+            if entry["status"] == "failed":
+                replay_reports(entry["log"])
+            report("watch_file_processed", path=entry["input"], status=entry["status"], messages=entry["messages"],
+                   seconds=entry["seconds"], queued=work.qsize())
+
+def watch_directory(directory, output_dir=None, jobs=1, parser=DEFAULT_PARSER, output_format=DEFAULT_FORMAT,
+                    stream=False, mmap=False, queue_size=WATCH_QUEUE_SIZE, debounce=WATCH_DEBOUNCE_SECONDS,
+                    poll_interval=WATCH_POLL_INTERVAL, polling=False, stats_path=None, stop=None):
+    """Converts the HTML files written into `directory` until interrupted or until `stop` (an Event) is set.
+
+    One process stays up with the parser imported (plus a warm pool of `jobs` processes if
+    jobs > 1). A file is converted once its size and mtime have not changed for `debounce`
+    seconds; files whose output is missing or older are picked up at start. Settled files
+    go through a queue of `queue_size` jobs: when it is full, the watcher waits instead of
+    piling up work. Returns the final stats, which are also written to `stats_path`.
+    """
+    jobs = max(1, jobs or 1)
+    work = queue.Queue(maxsize=queue_size)
+    watcher = open_watcher(directory, poll_interval, polling)
+    stats = WatchStats(os.path.abspath(directory), watcher.name, work, jobs)
+    if stats_path is None:
+        stats_path = os.path.join(output_dir or directory, WATCH_STATS_NAME)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    def output_path(path):
+        return default_output_path(os.path.join(output_dir, os.path.basename(path)) if output_dir else path,
+                                   output_format)
+
+    executor = None
+    if jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(max_workers=jobs, initializer=warm_worker, initargs=(parser, True))
+        for future in [executor.submit(os.getpid) for _ in range(jobs)]: # Start the workers now
+            future.result()
+    else:
+        warm_worker(parser)
+    finished = threading.Event()
+    workers = [threading.Thread(target=watch_worker, args=(work, executor, stats, current_session(), finished),
+                                daemon=True) for _ in range(jobs)]
+    for worker in workers:
+        worker.start()
+
+    pending = {} # path -> (signature, when it was last seen changing)
+    done = {} # path -> signature of the version that was queued
+    now = time.monotonic()
+    for path, signature in scan_watch_directory(directory).items():
+        output_signature = file_signature(output_path(path))
+        if output_signature is not None and output_signature[1] >= signature[1]:
+            done[path] = signature
+        else:
+            pending[path] = (signature, now - debounce)
+    report("watch_started", directory=directory, watcher=watcher.name, jobs=jobs, queue_size=queue_size,
+           stats=stats_path)
+
+    next_stats = now
+    try:
+        while stop is None or not stop.is_set():
+            changed, overflow = watcher.changes(debounce / 4 if pending else watcher.interval or WATCH_STATS_INTERVAL)
+            if overflow: # Events were dropped while we were busy: look at every file again
+                changed = set(scan_watch_directory(directory))
+            now = time.monotonic()
+            for path in changed:
+                if is_watched_name(os.path.basename(path)):
+                    pending[path] = (file_signature(path), now)
+            for path, (signature, since) in list(pending.items()):
+                current = file_signature(path)
+                if current is None:
+                    del pending[path]
+                elif current != signature:
+                    pending[path] = (current, now)
+                elif now - since >= debounce:
+                    del pending[path]
+                    if done.get(path) == current:
+                        continue
+                    done[path] = current
+                    job = batch_job(path, output_path(path), parser=parser, stream=stream, mmap=mmap,
+                                    chunk_size=STREAM_CHUNK_SIZE, cache_dir=None, cache_size=0, format=output_format,
+                                    profile=False, trace_memory=False)
+                    blocked = None
+                    while True:
+                        try:
+                            work.put((job, now), timeout=WATCH_STATS_INTERVAL if blocked else 0)
+                            break
+                        except queue.Full: # Backpressure: stop taking new files until a worker is free
+                            blocked = blocked or time.monotonic()
+                            stats.write(stats_path, len(pending))
+                            if stop is not None and stop.is_set():
+                                break
+                    if blocked:
+                        stats.backpressure(time.monotonic() - blocked)
+            if time.monotonic() >= next_stats:
+                stats.write(stats_path, len(pending))
+                next_stats = time.monotonic() + WATCH_STATS_INTERVAL
+    except KeyboardInterrupt:
+        pass
+    finally:
+        with interrupts_ignored():
+            watcher.close()
+            with contextlib.suppress(queue.Empty): # Queued files are picked up again at the next start
+                while True:
+                    work.get_nowait()
+            finished.set()
+            for worker in workers:
+                worker.join()
+            if executor is not None:
+                executor.shutdown()
+            stats.write(stats_path, len(pending))
+    final = stats.snapshot(len(pending))
+    report("watch_stopped", processed=final["files"]["processed"], failed=final["files"]["failed"], stats=stats_path)
+    return final
+# --- End Watch Mode ---
+
+# --- Library API ---
+def iter_messages(source, parser=DEFAULT_PARSER, stream=False, chunk_size=STREAM_CHUNK_SIZE, language=DEFAULT_LANG,
+                  log=None, metrics=None, mapped=False, jobs=None):
+    """Yields the messages of a chat export as {"speaker", "text"} dicts, without writing anything to disk.
+
+    `source` is a path, the export as bytes, or a binary or text file object. Status
+    messages are appended to `log` (a list) in `language` if given and dropped otherwise;
+    stage timings go to `metrics` (a `Metrics`) if given. Every call has its own session,
+    so extractions can run concurrently in threads or asyncio tasks. With `mapped`, files
+    are memory-mapped and bytes are scanned in place (see `iter_mapped_messages`); with
+    `jobs` > 1, the turns are also rendered on that many worker processes.
+
+    Raises ImportError right away if the parser backend is not installed; read errors
+    (e.g. FileNotFoundError) are raised while iterating.
+    """
+    backend = PARSER_BACKENDS[parser]
+    backend.require()
+    session = Session(language, log=log, quiet=log is None)
+    if metrics is not None:
+        session.metrics = metrics
+    export = ExportSource(source)
+    if jobs and jobs > 1:
+        messages = iter_parallel_source(source, parser, jobs)
+    elif mapped:
+        messages = iter_mapped_source(source, backend)
+    elif stream:
+        messages = iter_streamed_messages(export, backend, chunk_size)
+    else:
+        messages = iter_export_messages(export, backend)
+    return run_in_session(messages, session)
+
+def iter_conversations(source, chunk_size=STREAM_CHUNK_SIZE, language=DEFAULT_LANG, log=None, metrics=None):
+    """Yields the conversations of an account data export, one at a time.
+
+    `source` is the export zip or its `conversations.json`, as a path, bytes or a file
+    object. Each item is {"id", "title", "create_time", "messages"}, where "messages" are
+    the same {"speaker", "text"} records `iter_messages` yields. `log` and `metrics`
+    work as for `iter_messages`.
+    """
+    session = Session(language, log=log, quiet=log is None)
+    if metrics is not None:
+        session.metrics = metrics
+    return run_in_session(iter_export_conversations(source, chunk_size), session)
+
+def extract(source, **options):
+    """Returns the messages of a chat export as a list (see `iter_messages` for the options)."""
+    return list(iter_messages(source, **options))
+# --- End Library API ---
+
+def single_file_mode(args):
+    if args.cache_dir:
+        return "mapped" # The cache works on the turns of the byte scan
+    if args.jobs and args.jobs > 1:
+        return "parallel"
+    if args.mmap:
+        return "mapped"
+    return "stream" if args.stream else "tree"
+
+def cli_language(argv):
+    """The -l/--lang value in `argv`, read ahead of the full parse so that -h is localized too.
+
+    Unknown codes fall back to the default here and are rejected by the full parser.
+    """
+    pre_parser = argparse.ArgumentParser(add_help=False)
+    pre_parser.add_argument("-l", "--lang", dest="language", default=DEFAULT_LANG)
+    language = pre_parser.parse_known_args(argv)[0].language
+    return language if language in LANGUAGES else DEFAULT_LANG
+
+def index_main(argv):
+    """`index` subcommand: adds extracted conversations to the search index."""
+    set_language(cli_language(argv))
+    texts = current_session().texts
+    parser = argparse.ArgumentParser(prog="main.py index", description=texts["cli_index_description"])
+    parser.add_argument("inputs", nargs="+", help=texts["cli_index_inputs_help"])
+    parser.add_argument("--db", dest="db", default=INDEX_DB_NAME, help=texts["cli_db_help"].format(name=INDEX_DB_NAME))
+    parser.add_argument("--parser", dest="parser", choices=list(PARSER_BACKENDS), default=DEFAULT_PARSER,
+                        help=texts["cli_index_parser_help"].format(parser=DEFAULT_PARSER))
+    parser.add_argument("--prune", dest="prune", action="store_true", help=texts["cli_prune_help"])
+    parser.add_argument("-l", "--lang", dest="language", choices=list(LANGUAGES), default=DEFAULT_LANG,
+                        help=texts["cli_language_help"])
+    args = parser.parse_args(argv)
+    summary = index_files(args.inputs, args.db, args.parser, args.prune)
+    raise SystemExit(1 if summary["failed"] else 0)
+
+def search_main(argv):
+    """`search` subcommand: prints the best matching messages with highlighted snippets."""
+    set_language(cli_language(argv))
+    texts = current_session().texts
+    parser = argparse.ArgumentParser(prog="main.py search", description=texts["cli_search_description"])
+    parser.add_argument("query", help=texts["cli_query_help"])
+    parser.add_argument("--db", dest="db", default=INDEX_DB_NAME, help=texts["cli_db_help"].format(name=INDEX_DB_NAME))
+    parser.add_argument("-n", "--limit", dest="limit", type=int, default=DEFAULT_SEARCH_LIMIT,
+                        help=texts["cli_limit_help"].format(limit=DEFAULT_SEARCH_LIMIT))
+    parser.add_argument("--speaker", dest="speaker", choices=list(MESSAGE_RULES), default=None,
+                        help=texts["cli_speaker_help"])
+    parser.add_argument("--json", dest="as_json", action="store_true", help=texts["cli_search_json_help"])
+    parser.add_argument("-l", "--lang", dest="language", choices=list(LANGUAGES), default=DEFAULT_LANG,
+                        help=texts["cli_language_help"])
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.db):
+        report("error_index_not_found", path=args.db)
+        raise SystemExit(1)
+    index = SearchIndex(args.db)
+    try:
+        started = time.perf_counter()
+        results = index.search(args.query, args.limit, args.speaker)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+    finally:
+        index.close()
+    for result in results:
+        if args.as_json:
+            print(json.dumps(result, ensure_ascii=False))
+        else:
+            print(f"{result['path']} #{result['position']} {result['speaker']} ({result['score']:.4g})")
+            print("    " + result["snippet"].replace("\n", " "))
+    if not args.as_json:
+        report("search_summary", count=len(results), milliseconds=elapsed_ms)
+
+def watch_main(argv):
+    """`watch` subcommand: converts exports as they are dropped into a directory."""
+    set_language(cli_language(argv))
+    texts = current_session().texts
+    parser = argparse.ArgumentParser(prog="main.py watch", description=texts["cli_watch_description"])
+    parser.add_argument("directory", help=texts["cli_watch_directory_help"])
+    parser.add_argument("-o", "--output", dest="output_dir", default=None, help=texts["cli_watch_output_help"])
+    parser.add_argument("-j", "--jobs", dest="jobs", type=int, default=1, help=texts["cli_watch_jobs_help"])
+    parser.add_argument("--parser", dest="parser", choices=list(PARSER_BACKENDS), default=DEFAULT_PARSER,
+                        help=texts["cli_parser_help"].format(parser=DEFAULT_PARSER))
+    parser.add_argument("-f", "--format", dest="output_format", choices=list(OUTPUT_FORMATS), default=DEFAULT_FORMAT,
+                        help=texts["cli_format_help"].format(format=DEFAULT_FORMAT))
+    parser.add_argument("--stream", dest="stream", action="store_true", help=texts["cli_stream_help"])
+    parser.add_argument("--mmap", dest="mmap", action="store_true", help=texts["cli_mmap_help"])
+    parser.add_argument("--queue-size", dest="queue_size", type=int, default=WATCH_QUEUE_SIZE,
+                        help=texts["cli_queue_size_help"].format(size=WATCH_QUEUE_SIZE))
+    parser.add_argument("--debounce", dest="debounce", type=float, default=WATCH_DEBOUNCE_SECONDS,
+                        help=texts["cli_debounce_help"].format(seconds=WATCH_DEBOUNCE_SECONDS))
+    parser.add_argument("--poll", dest="polling", action="store_true", help=texts["cli_poll_help"])
+    parser.add_argument("--poll-interval", dest="poll_interval", type=float, default=WATCH_POLL_INTERVAL,
+                        help=texts["cli_poll_interval_help"].format(seconds=WATCH_POLL_INTERVAL))
+    parser.add_argument("--stats", dest="stats_path", default=None,
+                        help=texts["cli_stats_help"].format(seconds=WATCH_STATS_INTERVAL, name=WATCH_STATS_NAME))
+    parser.add_argument("-l", "--lang", dest="language", choices=list(LANGUAGES), default=DEFAULT_LANG,
+                        help=texts["cli_language_help"])
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.directory):
+        report("error_watch_directory", path=args.directory)
+        raise SystemExit(1)
+    import signal
+    signal.signal(signal.SIGTERM, signal.default_int_handler) # Stop cleanly under service managers too
+    watch_directory(args.directory, args.output_dir, args.jobs, args.parser, args.output_format, args.stream, args.mmap,
+                    args.queue_size, args.debounce, args.poll_interval, args.polling, args.stats_path)
+
+SUBCOMMANDS = {
+    "index": index_main,
+    "search": search_main,
+    "watch": watch_main,
+}
+
+def main(argv=None):
+    """Command-line entry point."""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in SUBCOMMANDS: # `main.py index|search|watch ...`; anything else is an HTML file
+        return SUBCOMMANDS[argv[0]](argv[1:])
+    # Set the language BEFORE building the parser, so that the -h output is translated too
+    set_language(cli_language(argv))
+    texts = current_session().texts
     # Initialize parser with general descriptions
     parser = argparse.ArgumentParser(
         description="Extracts chat history from HTML to JSON.",
@@ -312,7 +3175,8 @@ if __name__ == '__main__':
     )
     parser.add_argument(
         "html_file",
-        help="Path to the HTML file from which to extract data."
+        nargs="+",
+        help="Path to the HTML file from which to extract data (or several files, directories, glob patterns)."
     )
     parser.add_argument(
         "-o", "--output",
@@ -331,56 +3195,194 @@ if __name__ == '__main__':
         default="en",
         help="Language for script messages (en or ka). Default: en"
     )
-
-    args = parser.parse_args()
-
-    # Set language based on argument BEFORE updating help texts
-    set_language(args.language)
+    parser.add_argument(
+        "--stream",
+        dest="stream",
+        action="store_true",
+        help="Process the HTML incrementally, one conversation turn at a time."
+    )
+    parser.add_argument(
+        "--mmap",
+        dest="mmap",
+        action="store_true",
+        help="Memory-map the file and decode and parse one turn at a time."
+    )
+    parser.add_argument(
+        "--chunk-size",
+        dest="chunk_size",
+        type=int,
+        default=STREAM_CHUNK_SIZE,
+        help=f"Chunk size in characters for --stream. Default: {STREAM_CHUNK_SIZE}"
+    )
+    parser.add_argument(
+        "--parser",
+        dest="parser",
+        choices=list(PARSER_BACKENDS),
+        default=DEFAULT_PARSER,
+        help=f"HTML parser backend (html.parser, lxml or selectolax). Default: {DEFAULT_PARSER}"
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        dest="jobs",
+        type=int,
+        default=None,
+        help="Number of worker processes (batch mode: files; single file: turns when N > 1)."
+    )
+    parser.add_argument(
+        "--manifest",
+        dest="manifest",
+        default=None,
+        help=f"Batch mode: path of the JSON summary manifest. Default: {MANIFEST_NAME} in the output directory"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        dest="cache_dir",
+        default=None,
+        help="Directory of the incremental cache (skips unchanged files and already rendered turns)."
+    )
+    parser.add_argument(
+        "--cache-size",
+        dest="cache_size",
+        type=int,
+        default=DEFAULT_CACHE_SIZE_MB,
+        help=f"Maximum cache size in MB. Default: {DEFAULT_CACHE_SIZE_MB}"
+    )
+    parser.add_argument(
+        "-f", "--format",
+        dest="output_format",
+        choices=list(OUTPUT_FORMATS),
+        default=DEFAULT_FORMAT,
+        help=f"Output format: json (indented array) or jsonl (one message per line). Default: {DEFAULT_FORMAT}"
+    )
+    parser.add_argument(
+        "--metrics",
+        dest="metrics",
+        default=None,
+        help="Append per-file stage timings and counters as JSON Lines to this file ('-' for stderr)."
+    )
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        action="store_true",
+        help="Run under cProfile and save the stats as <output>.prof."
+    )
+    parser.add_argument(
+        "--trace-memory",
+        dest="trace_memory",
+        action="store_true",
+        help="Record the tracemalloc peak and top allocation sites in the metrics."
+    )
 
     # Update parser descriptions and help texts with the chosen language
-    # This makes the -h output also translated
-    parser.description = TEXTS["cli_description"]
+    parser.description = texts["cli_description"]
+    parser.epilog = texts["cli_subcommands"]
     for action in parser._actions:
         if action.dest == "html_file":
-            action.help = TEXTS["cli_html_file_help"]
+            action.help = texts["cli_html_file_help"]
         elif action.dest == "json_file": # Corresponds to --output
-            action.help = TEXTS["cli_output_help"]
+            action.help = texts["cli_output_help"]
         elif action.dest == "language": # Corresponds to --lang
-            action.help = TEXTS["cli_language_help"]
+            action.help = texts["cli_language_help"]
+        elif action.dest == "stream":
+            action.help = texts["cli_stream_help"]
+        elif action.dest == "mmap":
+            action.help = texts["cli_mmap_help"]
+        elif action.dest == "chunk_size":
+            action.help = texts["cli_chunk_size_help"].format(size=STREAM_CHUNK_SIZE)
+        elif action.dest == "parser":
+            action.help = texts["cli_parser_help"].format(parser=DEFAULT_PARSER)
+        elif action.dest == "jobs":
+            action.help = texts["cli_jobs_help"]
+        elif action.dest == "manifest":
+            action.help = texts["cli_manifest_help"].format(name=MANIFEST_NAME)
+        elif action.dest == "cache_dir":
+            action.help = texts["cli_cache_dir_help"]
+        elif action.dest == "cache_size":
+            action.help = texts["cli_cache_size_help"].format(size=DEFAULT_CACHE_SIZE_MB)
+        elif action.dest == "output_format":
+            action.help = texts["cli_format_help"].format(format=DEFAULT_FORMAT)
+        elif action.dest == "metrics":
+            action.help = texts["cli_metrics_help"]
+        elif action.dest == "profile":
+            action.help = texts["cli_profile_help"]
+        elif action.dest == "trace_memory":
+            action.help = texts["cli_trace_memory_help"]
 
+    args = parser.parse_args(argv)
 
-    html_input_path = args.html_file
-    json_output_path = args.json_file
+    if args.cache_dir:
+        ignored = ["--stream"] if args.stream else []
+        if args.jobs and args.jobs > 1 and not is_batch_request(args.html_file):
+            ignored.append("--jobs")
+        if ignored:
+            report("cache_overrides_options", options=", ".join(ignored))
 
-    if json_output_path is None:
-        base = os.path.splitext(html_input_path)[0]
-        json_output_path = base + ".json"
+    if is_batch_request(args.html_file):
+        manifest = run_batch(args.html_file, args.json_file, args.jobs, args.parser, args.stream,
+                             args.chunk_size, args.manifest, args.cache_dir, args.cache_size * 1024 * 1024,
+                             args.output_format, args.metrics, args.profile, args.trace_memory, args.mmap)
+        raise SystemExit(0 if manifest and not manifest["summary"]["failed"] else 1)
 
-    extract_chat_history_to_json(html_input_path, json_output_path)
+    html_input_path = args.html_file[0]
+    json_output_path = args.json_file
+    writer = None
+
+    if is_data_export(html_input_path):
+        mode = "export"
+        if json_output_path is None:
+            json_output_path = default_export_output(html_input_path)
+    else:
+        mode = single_file_mode(args)
+        if json_output_path is None:
+            json_output_path = default_output_path(html_input_path, args.output_format)
+        # The writer records counts and the first/last message while writing, so the
+        # verification below does not need to read the output file back.
+        writer = MESSAGE_WRITERS[args.output_format](json_output_path)
+    profile_path = json_output_path.rstrip("/\\") + ".prof" if args.profile else None
+    started = time.perf_counter()
+    with capture_profile(profile_path, args.trace_memory):
+        if mode == "export":
+            count = export_conversations(html_input_path, json_output_path, args.output_format, args.chunk_size)
+        elif args.cache_dir:
+            cache = ExtractionCache(args.cache_dir, args.cache_size * 1024 * 1024)
+            try:
+                count = cached_chat_history_to_json(html_input_path, json_output_path, cache, args.chunk_size,
+                                                    args.parser, args.output_format, writer)
+            finally:
+                cache.close()
+            report("cache_stats", **cache.stats)
+        elif mode == "parallel":
+            count = parallel_chat_history_to_json(html_input_path, json_output_path, args.parser, args.output_format,
+                                                  writer, args.jobs)
+        elif args.mmap:
+            count = mapped_chat_history_to_json(html_input_path, json_output_path, args.parser, args.output_format,
+                                                writer)
+        elif args.stream:
+            count = stream_chat_history_to_json(html_input_path, json_output_path, args.chunk_size, args.parser,
+                                                output_format=args.output_format, writer=writer)
+        else:
+            count = extract_chat_history_to_json(html_input_path, json_output_path, args.parser, args.output_format,
+                                                 writer)
+    if args.metrics:
+        emit_metrics(metrics_record(html_input_path, json_output_path if count else None, args.parser, mode,
+                                    args.output_format, count, time.perf_counter() - started,
+                                    current_metrics().as_dict()), args.metrics)
+        if args.metrics != "-":
+            report("metrics_written", path=args.metrics)
+    if profile_path:
+        report("profile_written", path=profile_path)
 
     # --- Verification (Optional) ---
-    if os.path.exists(json_output_path):
-        try:
-            with open(json_output_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                if data:
-                    print(TEXTS["verification_header"])
-                    print(TEXTS["verification_extracted_count"].format(count=len(data)))
-                    if len(data) > 0:
-                        print(TEXTS["verification_first_message"])
-                        print(json.dumps(data[0], ensure_ascii=False, indent=2))
-                    if len(data) > 1:
-                        print(TEXTS["verification_last_message"])
-                        print(json.dumps(data[-1], ensure_ascii=False, indent=2))
-                else:
-                    print(TEXTS["verification_json_empty"].format(path=json_output_path))
-        except FileNotFoundError:
-            # This state implies extract_chat_history_to_json would have printed an error
-            pass
-        except json.JSONDecodeError:
-            print(TEXTS["error_decode_json"].format(path=json_output_path))
-        except Exception as e:
-            print(TEXTS["error_verification"].format(error=e))
-    # else:
-        # If the file doesn't exist, extract_chat_history_to_json should have handled the error message.
-        # print(TEXTS["verification_json_not_created"].format(path=json_output_path)) # Potentially redundant
\ No newline at end of file
+    if count and writer is not None:
+        print(texts["verification_header"])
+        print(texts["verification_extracted_count"].format(count=count))
+        # Unchanged files skipped by the cache were not rewritten, so only the count is known
+        if writer.first_message is not None:
+            print(texts["verification_first_message"])
+            print(json.dumps(writer.first_message, ensure_ascii=False, indent=2))
+        if writer.count > 1:
+            print(texts["verification_last_message"])
+            print(json.dumps(writer.last_message, ensure_ascii=False, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Incremental cache: whole-file hits, turn reuse for exports that grew, and LRU eviction."""
+import json
+import shutil
+
+import pytest
+
+import main
+
+from test_parity import fixture_path, write_output
+
+def cached_run(html_path, output_path, cache_dir, parser="html.parser"):
+    cache = main.ExtractionCache(str(cache_dir))
+    try:
+        with main.use_session(main.Session(quiet=True)):
+            count = main.cached_chat_history_to_json(str(html_path), str(output_path), cache, parser=parser)
+    finally:
+        cache.close()
+    return count, cache.stats
+
+def test_unchanged_file_is_skipped(tmp_path):
+    html_path = tmp_path / "turns.html"
+    shutil.copy(fixture_path("turns"), html_path)
+    count, stats = cached_run(html_path, tmp_path / "turns.json", tmp_path / "cache")
+    assert count == 5 and stats["file_misses"] == 1 and stats["turn_misses"] == 5
+    count, stats = cached_run(html_path, tmp_path / "turns.json", tmp_path / "cache")
+    assert count == 5 and stats["file_hits"] == 1 and stats["turn_hits"] == stats["turn_misses"] == 0
+
+def test_appended_turn_is_the_only_one_rendered(tmp_path, monkeypatch):
+    html_path = tmp_path / "turns.html"
+    shutil.copy(fixture_path("turns"), html_path)
+    cached_run(html_path, tmp_path / "turns.json", tmp_path / "cache")
+
+    data = html_path.read_bytes()
+    appended = (b'<article data-testid="conversation-turn-5"><div data-message-author-role="user">'
+                b'<div class="whitespace-pre-wrap">One more question</div></div></article>\n')
+    html_path.write_bytes(data.replace(b"</main>", appended + b"</main>"))
+    rendered = []
+    render_turn_slice = main.render_turn_slice
+
+    def counting_render(raw, *args):
+        rendered.append(bytes(raw))
+        return render_turn_slice(raw, *args)
+
+    monkeypatch.setattr(main, "render_turn_slice", counting_render)
+    count, stats = cached_run(html_path, tmp_path / "turns.json", tmp_path / "cache")
+    monkeypatch.undo()
+
+    assert count == 6
+    assert (stats["turn_hits"], stats["turn_misses"]) == (5, 1)
+    assert rendered == [appended.rstrip(b"\n")]
+    assert (tmp_path / "turns.json").read_bytes() == write_output("tree", str(html_path), tmp_path / "tree.json",
+                                                                  "html.parser", "json")
+
+def test_turns_are_not_shared_between_parsers(tmp_path):
+    pytest.importorskip("lxml")
+    html_path = tmp_path / "turns.html"
+    shutil.copy(fixture_path("turns"), html_path)
+    cached_run(html_path, tmp_path / "turns.json", tmp_path / "cache")
+    count, stats = cached_run(html_path, tmp_path / "turns.json", tmp_path / "cache", parser="lxml")
+    assert count == 5
+    assert (stats["file_hits"], stats["turn_hits"], stats["turn_misses"]) == (0, 0, 5)
+
+def test_least_recently_used_entries_are_evicted_first(tmp_path, monkeypatch):
+    clock = iter(range(1, 100))
+    monkeypatch.setattr(main.time, "time", lambda: next(clock))
+    value = "x" * 100
+    size = 1 + len(json.dumps(value)) # Key plus encoded value
+    cache = main.ExtractionCache(str(tmp_path), max_bytes=2 * size + size // 2)
+    cache.put("a", value)
+    cache.put("b", value)
+    cache.commit()
+    assert cache.get("a") == value # "b" is now the least recently used
+    cache.commit()
+    cache.put("c", value)
+    cache.commit()
+    assert cache.stats["evictions"] == 1
+    assert [cache.get(key) is not None for key in "abc"] == [True, False, True]
+    cache.close()
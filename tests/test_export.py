@@ -0,0 +1,174 @@
+"""Account data export ingestion: the incremental JSON array reader, branches, filtering and file names."""
+import io
+import json
+import zipfile
+
+import pytest
+
+import main
+
+from test_parity import fixture_path
+
+EXPECTED_CONVERSATIONS = [
+    {"id": "6a1f0c2e-0000-4000-8000-000000000001", "title": "Deploy: staging vs. prod?", "create_time": 1718000000.123456,
+     "messages": [{"speaker": "user", "text": "Edited wording with a ქართული word"},
+                  {"speaker": "assistant", "text": "Use \"staging\" first.\n\n- step 1\n- step 2"}]},
+    {"id": "6A1F0C2E-ffff-4000-8000-000000000002", "title": "Deploy: staging vs. prod?", "create_time": 1718000100,
+     "messages": [{"speaker": "user", "text": "Same title, same id prefix"},
+                  {"speaker": "assistant", "text": "Regenerated answer"}]},
+    {"id": None, "title": "", "create_time": None, "messages": []},
+]
+# Numbers and strings of every length, so small chunk sizes split them at every position
+ARRAY = '[0, -12.5e3, 123456789, 1.0E-2, "", "a\\"b\\\\c\\u00e9\\ud83d\\ude00", "ქართული", true, false, null, [], {}, ' \
+        '[1, [2, "]"]], {"k": "v,]", "n": -0}]'
+
+def read_array(text, chunk_size):
+    with main.use_session(main.Session(quiet=True)):
+        return list(main.iter_json_array(io.StringIO(text), chunk_size))
+
+def conversations(source, chunk_size=main.STREAM_CHUNK_SIZE):
+    return list(main.iter_conversations(source, chunk_size))
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 64, main.STREAM_CHUNK_SIZE])
+def test_json_array_matches_json_module(chunk_size):
+    assert read_array(ARRAY, chunk_size) == json.loads(ARRAY)
+    with open(fixture_path("conversations", ".json"), encoding="utf-8") as f:
+        text = f.read()
+    assert read_array(text, chunk_size) == json.loads(text)
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3])
+@pytest.mark.parametrize("text, expected", [
+    ("[]", []),
+    (" \n[ ] ", []),
+    ("[12345]", [12345]),
+    ("[1,23,456]", [1, 23, 456]),
+    ("[-0.5e-10 ,\n7]", [-0.5e-10, 7]),
+    ('["split string", "x"]', ["split string", "x"]),
+])
+def test_json_array_values_split_across_chunks(text, expected, chunk_size):
+    assert read_array(text, chunk_size) == expected
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 1024])
+@pytest.mark.parametrize("text", [
+    "",
+    "[",
+    "[1",
+    "[1,",
+    "[1, 2",
+    '["unterminated',
+    '[{"a": 1}',
+    '[{"a": 1',
+    "{}",
+    "[1 2]",
+    "[1,]",
+    "[,1]",
+    "[01]",
+    "[tru]",
+])
+def test_json_array_rejects_truncated_and_malformed_input(text, chunk_size):
+    with pytest.raises(ValueError):
+        read_array(text, chunk_size)
+
+def test_active_branch_follows_current_node():
+    mapping = {
+        "r": {"parent": None, "children": ["a", "b"]},
+        "a": {"parent": "r", "children": []},
+        "b": {"parent": "r", "children": ["c"]},
+        "c": {"parent": "b", "children": []},
+    }
+    assert active_branch_ids(mapping, "a") == ["r", "a"]
+    assert active_branch_ids(mapping, "c") == ["r", "b", "c"]
+    # Without a valid current node, the newest branch (last child at every level) is shown
+    assert active_branch_ids(mapping, None) == ["r", "b", "c"]
+    assert active_branch_ids(mapping, "missing") == ["r", "b", "c"]
+    assert active_branch_ids({}, None) == []
+
+def test_active_branch_survives_damaged_mappings():
+    cycle = {"a": {"parent": "b", "children": ["b"]}, "b": {"parent": "a", "children": ["a"]}}
+    assert sorted(active_branch_ids(cycle, "a")) == ["a", "b"]
+    dangling = {"a": {"parent": "gone", "children": ["gone", "b"]}, "b": {"parent": "a", "children": None}}
+    assert active_branch_ids(dangling, None) == ["a", "b"]
+
+def active_branch_ids(mapping, current_node):
+    for node_id, node in mapping.items():
+        node["id"] = node_id
+    return [node["id"] for node in main.active_branch(mapping, current_node)]
+
+@pytest.mark.parametrize("message, expected", [
+    (None, None),
+    ({"author": {"role": "user"}, "content": {"content_type": "text", "parts": [" hi "]}},
+     {"speaker": "user", "text": "hi"}),
+    ({"author": {"role": "assistant"}, "content": {"content_type": "multimodal_text", "parts": [{"asset": 1}, "a", "b"]}},
+     {"speaker": "assistant", "text": "a\nb"}),
+    ({"author": {"role": "system"}, "content": {"content_type": "text", "parts": ["system prompt"]}}, None),
+    ({"author": {"role": "tool"}, "content": {"content_type": "text", "parts": ["result"]}}, None),
+    ({"author": {"role": "assistant"}, "recipient": "python", "content": {"content_type": "text", "parts": ["x"]}}, None),
+    ({"author": {"role": "assistant"}, "content": {"content_type": "code", "text": "print(1)"}}, None),
+    ({"author": {"role": "user"}, "metadata": {"is_visually_hidden_from_conversation": True},
+      "content": {"content_type": "text", "parts": ["hidden"]}}, None),
+    ({"author": {"role": "user"}, "content": {"content_type": "text", "parts": ["", "  "]}}, None),
+    ({"author": None, "content": None}, None),
+])
+def test_export_message(message, expected):
+    assert main.export_message(message) == expected
+
+def test_conversation_filenames_never_clash():
+    taken = set()
+    names = [main.conversation_filename({"title": title, "id": conversation_id}, index, "json", taken)
+             for index, (title, conversation_id) in enumerate([
+                 ("Deploy: staging vs. prod?", "6a1f0c2e-1"),
+                 ("Deploy: staging vs. prod?", "6A1F0C2E-2"), # Same name on a case-insensitive file system
+                 ("Deploy  staging / prod", "6a1f0c2e-3"),
+                 ("Deploy-staging-vs-prod-6a1f0c2e", None),
+                 ("", None),
+                 ("???", "abc"),
+             ])]
+    assert names == [
+        "Deploy-staging-vs-prod-6a1f0c2e.json",
+        "Deploy-staging-vs-prod-6A1F0C2E-2.json",
+        "Deploy-staging-prod-6a1f0c2e.json",
+        "Deploy-staging-vs-prod-6a1f0c2e-3.json",
+        "conversation-4.json",
+        "conversation-abc.json",
+    ]
+    assert len({name.lower() for name in names}) == len(names)
+
+@pytest.mark.parametrize("chunk_size", [1, 7, main.STREAM_CHUNK_SIZE])
+def test_conversations_from_json_and_zip(tmp_path, chunk_size):
+    json_path = fixture_path("conversations", ".json")
+    zip_path = tmp_path / "export.zip"
+    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("chat.html", "<html></html>")
+        archive.writestr("nested/conversations.json", "[]")
+        archive.write(json_path, "conversations.json")
+    assert conversations(json_path, chunk_size) == EXPECTED_CONVERSATIONS
+    assert conversations(str(zip_path), chunk_size) == EXPECTED_CONVERSATIONS
+    assert conversations(zip_path.read_bytes(), chunk_size) == EXPECTED_CONVERSATIONS
+    with open(zip_path, "rb") as f:
+        assert conversations(f, chunk_size) == EXPECTED_CONVERSATIONS
+
+def test_zip_without_conversations_is_reported(tmp_path):
+    zip_path = tmp_path / "export.zip"
+    with zipfile.ZipFile(zip_path, "w") as archive:
+        archive.writestr("chat.html", "<html></html>")
+    log = []
+    with main.use_session(main.Session(log=log)):
+        assert main.export_conversations(str(zip_path), str(tmp_path / "out")) is None
+    assert [entry["kind"] for entry in log] == ["error_reading_export"]
+
+def test_export_to_files_and_to_json_lines(tmp_path):
+    zip_path = tmp_path / "export.zip"
+    with zipfile.ZipFile(zip_path, "w") as archive:
+        archive.write(fixture_path("conversations", ".json"), "conversations.json")
+    with main.use_session(main.Session(quiet=True)):
+        assert main.export_conversations(str(zip_path), str(tmp_path / "out")) == 4
+        assert main.export_conversations(str(zip_path), str(tmp_path / "all.jsonl")) == 4
+    files = sorted(path.name for path in (tmp_path / "out").iterdir())
+    assert files == ["Deploy-staging-vs-prod-6A1F0C2E-2.json", "Deploy-staging-vs-prod-6a1f0c2e.json"]
+    first = json.loads((tmp_path / "out" / files[1]).read_text(encoding="utf-8"))
+    assert first == EXPECTED_CONVERSATIONS[0]["messages"]
+    records = [json.loads(line) for line in (tmp_path / "all.jsonl").read_text(encoding="utf-8").splitlines()]
+    assert [record["conversation_id"] for record in records] == [EXPECTED_CONVERSATIONS[0]["id"]] * 2 + \
+        [EXPECTED_CONVERSATIONS[1]["id"]] * 2
+    assert records[3] == {"conversation_id": EXPECTED_CONVERSATIONS[1]["id"], "title": "Deploy: staging vs. prod?",
+                          "speaker": "assistant", "text": "Regenerated answer"}
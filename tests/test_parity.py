@@ -0,0 +1,122 @@
+"""Parity of the parser backends and extraction modes on small fixture exports.
+
+`fixtures/<name>.json` is the tree mode output of `fixtures/<name>.html` with html.parser.
+Every backend in every mode must extract the same messages, and the files written by
+the streaming, memory-mapped and parallel modes must be byte-identical to tree mode.
+"""
+import io
+import json
+import os
+
+import pytest
+
+import main
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+FIXTURES = ("turns", "containers", "nested", "nested_turns", "truncated")
+BACKEND_MODULES = {"html.parser": "bs4", "lxml": "lxml", "selectolax": "selectolax"}
+MODES = {
+    "tree": {},
+    "stream": {"stream": True},
+    "mapped": {"mapped": True},
+    "parallel": {"jobs": 2},
+}
+WRITERS = {
+    "tree": lambda html, output, parser, fmt: main.extract_chat_history_to_json(html, output, parser, fmt),
+    "stream": lambda html, output, parser, fmt: main.stream_chat_history_to_json(html, output, parser=parser,
+                                                                                 output_format=fmt),
+    "mapped": lambda html, output, parser, fmt: main.mapped_chat_history_to_json(html, output, parser, fmt),
+    "parallel": lambda html, output, parser, fmt: main.parallel_chat_history_to_json(html, output, parser, fmt,
+                                                                                     jobs=2),
+}
+
+def fixture_path(name, extension=".html"):
+    return os.path.join(FIXTURES_DIR, name + extension)
+
+def expected_messages(name):
+    with open(fixture_path(name, ".json"), encoding="utf-8") as f:
+        return json.load(f)
+
+def write_output(mode, html_path, output_path, parser, output_format):
+    with main.use_session(main.Session(quiet=True)):
+        count = WRITERS[mode](html_path, str(output_path), parser, output_format)
+    assert count
+    with open(output_path, "rb") as f:
+        return f.read()
+
+@pytest.mark.parametrize("parser", BACKEND_MODULES)
+@pytest.mark.parametrize("mode", MODES)
+@pytest.mark.parametrize("name", FIXTURES)
+def test_extract_matches_reference(name, mode, parser):
+    pytest.importorskip(BACKEND_MODULES[parser])
+    assert main.extract(fixture_path(name), parser=parser, **MODES[mode]) == expected_messages(name)
+
+@pytest.mark.parametrize("name", FIXTURES)
+def test_tree_output_matches_reference_file(tmp_path, name):
+    with open(fixture_path(name, ".json"), "rb") as f:
+        reference = f.read()
+    assert write_output("tree", fixture_path(name), tmp_path / "out.json", "html.parser", "json") == reference
+
+@pytest.mark.parametrize("output_format", main.OUTPUT_FORMATS)
+@pytest.mark.parametrize("parser", BACKEND_MODULES)
+@pytest.mark.parametrize("mode", [mode for mode in MODES if mode != "tree"])
+@pytest.mark.parametrize("name", FIXTURES)
+def test_output_is_byte_identical_to_tree_mode(tmp_path, name, mode, parser, output_format):
+    pytest.importorskip(BACKEND_MODULES[parser])
+    extension = main.OUTPUT_FORMATS[output_format]
+    reference = write_output("tree", fixture_path(name), tmp_path / ("tree" + extension), "html.parser", output_format)
+    output = write_output(mode, fixture_path(name), tmp_path / (mode + extension), parser, output_format)
+    assert output == reference
+
+@pytest.mark.parametrize("mode", MODES)
+def test_bom_and_crlf_input(tmp_path, mode):
+    with open(fixture_path("turns"), "rb") as f:
+        data = b"\xef\xbb\xbf" + f.read().replace(b"\n", b"\r\n")
+    html_path = tmp_path / "crlf.html"
+    html_path.write_bytes(data)
+    assert main.extract(str(html_path), **MODES[mode]) == expected_messages("turns")
+    assert main.extract(data, **MODES[mode]) == expected_messages("turns")
+
+LATIN_1_PAGE = ('<html><head><meta charset="iso-8859-1"></head><body><article data-testid="conversation-turn-0">'
+                '<div data-message-author-role="user"><div class="whitespace-pre-wrap">{}</div></div></article></body></html>')
+
+@pytest.mark.parametrize("parser", BACKEND_MODULES)
+@pytest.mark.parametrize("mode", MODES)
+def test_meta_charset_is_used_in_every_mode(tmp_path, mode, parser):
+    pytest.importorskip(BACKEND_MODULES[parser])
+    data = LATIN_1_PAGE.format("café naïve").encode("latin-1")
+    html_path = tmp_path / "latin-1.html"
+    html_path.write_bytes(data)
+    for source in (data, str(html_path), io.BytesIO(data)):
+        assert main.extract(source, parser=parser, **MODES[mode]) == [{"speaker": "user", "text": "café naïve"}]
+
+@pytest.mark.parametrize("mode", MODES)
+def test_text_source_is_not_decoded_again(mode):
+    source = io.StringIO(LATIN_1_PAGE.format("გამარჯობა café"))
+    assert main.extract(source, **MODES[mode]) == [{"speaker": "user", "text": "გამარჯობა café"}]
+
+def failing_formatter(text_div):
+    raise RuntimeError("renderer bug")
+
+@pytest.mark.parametrize("mode", MODES)
+def test_unexpected_errors_are_reported_and_keep_the_previous_output(tmp_path, monkeypatch, mode):
+    monkeypatch.setitem(main.MESSAGE_RULES, "assistant", ("markdown", failing_formatter))
+    output_path = tmp_path / "out.json"
+    output_path.write_text("previous")
+    log = []
+    with main.use_session(main.Session(log=log)):
+        count = WRITERS[mode](fixture_path("turns"), str(output_path), "html.parser", "json")
+    assert count is None
+    assert [entry["kind"] for entry in log] == ["error_unexpected"]
+    assert "renderer bug" in log[0]["text"]
+    assert output_path.read_text() == "previous"
+    assert os.listdir(tmp_path) == ["out.json"]
+
+@pytest.mark.parametrize("mode", MODES)
+def test_read_errors_are_reported(tmp_path, mode):
+    html_path = tmp_path / "broken.html"
+    html_path.write_bytes(b'<meta charset="utf-8"><article data-testid="conversation-turn-0">\xff\xfe\xfa</article>')
+    log = []
+    with main.use_session(main.Session(log=log)):
+        assert WRITERS[mode](str(html_path), str(tmp_path / "out.json"), "html.parser", "json") is None
+    assert [entry["kind"] for entry in log] == ["error_reading_html"]
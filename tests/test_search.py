@@ -0,0 +1,53 @@
+"""Search index: the tool's own files are skipped and each conversation is indexed once."""
+import json
+import os
+import shutil
+
+import pytest
+
+import main
+
+from test_parity import fixture_path
+
+pytest.importorskip("bs4")
+
+def index_directory(directory, db_path, *extra_inputs):
+    with main.use_session(main.Session(quiet=True)):
+        return main.index_files([str(path) for path in extra_inputs] + [str(directory)], str(db_path))
+
+def indexed_paths(db_path):
+    index = main.SearchIndex(str(db_path))
+    try:
+        return sorted(os.path.basename(path) for (path,) in index.db.execute("SELECT path FROM files"))
+    finally:
+        index.close()
+
+@pytest.fixture
+def watch_output(tmp_path):
+    """A directory as watch mode leaves it: an export, its output, the stats and a manifest."""
+    directory = tmp_path / "chats"
+    directory.mkdir()
+    shutil.copy(fixture_path("turns"), directory / "chat.html")
+    shutil.copy(fixture_path("turns", ".json"), directory / "chat.json")
+    (directory / main.WATCH_STATS_NAME).write_text(json.dumps({"files": {"processed": 1}}))
+    (directory / main.MANIFEST_NAME).write_text(json.dumps({"summary": {}, "files": []}))
+    return directory
+
+def test_export_and_its_output_are_indexed_once(tmp_path, watch_output):
+    summary = index_directory(watch_output, tmp_path / "index.sqlite3")
+    assert (summary["indexed"], summary["failed"], summary["messages"]) == (1, 0, 5)
+    assert indexed_paths(tmp_path / "index.sqlite3") == ["chat.json"]
+
+def test_newer_export_replaces_its_stale_output(tmp_path, watch_output):
+    index_directory(watch_output, tmp_path / "index.sqlite3")
+    stat = os.stat(watch_output / "chat.json")
+    os.utime(watch_output / "chat.html", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    summary = index_directory(watch_output, tmp_path / "index.sqlite3")
+    assert (summary["indexed"], summary["removed"], summary["messages"]) == (1, 1, 5)
+    assert indexed_paths(tmp_path / "index.sqlite3") == ["chat.html"]
+
+def test_index_database_in_the_directory_is_skipped(watch_output):
+    db_path = watch_output / main.INDEX_DB_NAME
+    index_directory(watch_output, db_path)
+    summary = index_directory(watch_output, db_path, db_path)
+    assert (summary["failed"], summary["unchanged"]) == (0, 1)
@@ -0,0 +1,30 @@
+"""Watch mode shutdown: a second interrupt during cleanup must not cut it short."""
+import json
+import os
+import signal
+
+import pytest
+
+import main
+
+class InterruptedWatcher:
+    """Interrupts the watch loop, then signals again while it is being closed (like `timeout -s INT`)."""
+    name = "test"
+    interval = 0.01
+
+    def changes(self, timeout):
+        raise KeyboardInterrupt
+
+    def close(self):
+        os.kill(os.getpid(), signal.SIGINT)
+
+@pytest.mark.skipif(not hasattr(os, "kill") or os.name != "posix", reason="needs POSIX signals")
+def test_second_interrupt_during_shutdown_is_ignored(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "open_watcher", lambda *args: InterruptedWatcher())
+    stats_path = tmp_path / "stats.json"
+    handler = signal.getsignal(signal.SIGINT)
+    with main.use_session(main.Session(quiet=True)):
+        final = main.watch_directory(str(tmp_path), stats_path=str(stats_path))
+    assert final["files"]["processed"] == 0
+    assert json.loads(stats_path.read_text())["watcher"] == "test"
+    assert signal.getsignal(signal.SIGINT) is handler